@@ -1,13 +1,22 @@
 import unittest
 import bitarray
+import io
+import os
+import tempfile
+import threading
 from tools.ModularMath import ModularMath
 from tools.Cipher import RSA, SerpentCipher
 from tools.Hash import sha256, hmac_sha256
+from tools import Hash
 from tools.CertificateAuthority import CertificateAuthority
 from tools.User import User
-from tools.KDF import KDF
+from tools.KDF import KDF, KDFCheckpoints
 from tools.Conversation import Conversation
-from tools.BlockChain import Blockchain
+from tools.BlockChain import Block, Blockchain
+from tools.BlockStore import BlockStore
+from tools.ChunkStore import ChunkStore
+from tools.KeyPool import KeyPool
+from tools import ProcessPool
 import json
 
 class TestGCD(unittest.TestCase):
@@ -76,6 +85,20 @@ class TestIsPrime(unittest.TestCase):
     def test_is_prime_5(self):
                 self.assertEqual(ModularMath.is_prime(13216587986546542), False)
 
+    def test_generate_prime_number(self):
+        ModularMath.reset_prime_stats()
+        for bits in (12, 32, 256):
+            p = ModularMath.generate_prime_number(bits)
+            self.assertEqual(p.bit_length(), bits)
+            self.assertTrue(ModularMath.is_prime(p, 40))
+            self.assertTrue(all(p % prime for prime in ModularMath.SMALL_PRIMES if prime < p))
+
+        stats = ModularMath.prime_stats
+        self.assertEqual(stats['primes'], 3)
+        self.assertEqual(stats['candidates'], stats['sieve_rejects'] + stats['miller_rabin_rejects'] + stats['primes'])
+        self.assertEqual(ModularMath.miller_rabin_rounds(1024), 3)
+        self.assertEqual(ModularMath.miller_rabin_rounds(64), 27)
+
 class TestCirularShift(unittest.TestCase):
         
     def test_circular_shift_1(self):
@@ -136,6 +159,35 @@ class TestRSA(unittest.TestCase):
         public_key2, private_key2 = RSA.keyGen()
         cipher2 = RSA(public_key2, private_key2)
         self.assertEqual(cipher2.verify("Hello World", signature), False)
+
+    def test_rsa_crt(self):
+        public_key, private_key = RSA.keyGen()
+        self.assertEqual(len(private_key), 7)
+        legacy = RSA(public_key, private_key[:2])
+        cipher = RSA(public_key, private_key)
+        message = "Hello World!"
+        self.assertEqual(cipher.sign(message), legacy.sign(message))
+        self.assertEqual(legacy.decrypt(cipher.encrypt(message, key="Private"), key="Public"), message)
+        self.assertEqual(cipher.decrypt(legacy.encrypt(message)), message)
+        self.assertEqual(RSA.privatePow(private_key[2] * 5, private_key), pow(private_key[2] * 5, private_key[1], private_key[0]))
+
+        # 917519 - 1 is a multiple of 65537, d does not exist
+        self.assertRaises(ValueError, RSA.keysFromPrimes, 917519, 1000003)
+        self.assertNotEqual((private_key[2] - 1) % RSA.E, 0)
+        self.assertNotEqual((private_key[3] - 1) % RSA.E, 0)
+
+    def test_rsa_parallel_keygen(self):
+        keys = [RSA.keyGen(workers=2)] + RSA.keyGenMany(2, workers=2)
+        self.assertEqual(len(keys), 3)
+        for public_key, private_key in keys:
+            self.assertEqual(public_key[0], private_key[2] * private_key[3])
+            self.assertNotEqual(private_key[2], private_key[3])
+            cipher = RSA(public_key, private_key)
+            self.assertEqual(cipher.decrypt(cipher.encrypt("Hello World!")), "Hello World!")
+
+        stop = threading.Event()
+        stop.set()
+        self.assertIsNone(ModularMath.generate_prime_number(1024, stop=stop))
         
 
 
@@ -149,6 +201,122 @@ class TestSerpent(unittest.TestCase):
         decrypted_message = Serpent.decrypt(encrypted_message)
         self.assertEqual(message, decrypted_message)
 
+    def test_serpent_engines_identical(self):
+        key = SerpentCipher.keyGen()
+        reference = SerpentCipher(key, engine="bitarray")
+        fast = SerpentCipher(key, engine="int")
+        message = "Hello World! " * 5
+        encrypted_message = reference.encrypt(message)
+        self.assertEqual(fast.encrypt(message), encrypted_message)
+        self.assertEqual(fast.decrypt(encrypted_message), message)
+
+    def test_serpent_key_schedule(self):
+        key = SerpentCipher.keyGen()
+        Serpent = SerpentCipher(key, engine="bitarray")
+        self.assertEqual(Serpent.getIterationKeys(), Serpent.iterationKeysGen())
+        self.assertIs(SerpentCipher(key).getRoundKeys(), Serpent.getRoundKeys())
+
+    def test_serpent_shared_sbox(self):
+        SBox = SerpentCipher.sBoxGen()
+        self.assertEqual(SerpentCipher.sharedSBox(), SBox)
+        for round_sbox, round_inverse in zip(SBox, SerpentCipher.sharedInverseSBox()):
+            for sbox, inverse in zip(round_sbox, round_inverse):
+                self.assertEqual([inverse[sbox[value]] for value in range(16)], list(range(16)))
+        self.assertIs(SerpentCipher("0" * 256).SBox, SerpentCipher("1" * 256).SBox)
+
+    def test_serpent_permutations(self):
+        for _ in range(10):
+            block = bitarray.bitarray(SerpentCipher.keyGen()[:128])
+            state = SerpentCipher.bitsToInt(block)
+            self.assertEqual(SerpentCipher.initialPermutationInt(state), SerpentCipher.bitsToInt(SerpentCipher.blockInitialPermutation(block)))
+            self.assertEqual(SerpentCipher.finalPermutationInt(state), SerpentCipher.bitsToInt(SerpentCipher.blockFinalPermutation(block)))
+
+    def test_serpent_bytes(self):
+        Serpent = SerpentCipher(SerpentCipher.keyGen())
+        for data in [b"", b"\x00" * 16, bytes(range(256)) + b"\x00\x00"]:
+            encrypted_data = Serpent.encrypt_bytes(data)
+            self.assertEqual(len(encrypted_data) % 16, 0)
+            self.assertEqual(Serpent.decrypt_bytes(encrypted_data), data)
+
+    def test_serpent_legacy_ciphertext(self):
+        Serpent = SerpentCipher(SerpentCipher.keyGen())
+        message = "Hello World!"
+        blocks = SerpentCipher.splitPlainTextToBlocks(message)
+        legacy = bitarray.bitarray()
+        legacy.frombytes(Serpent.encryptBlocks(b"".join(block.tobytes() for block in blocks)))
+        self.assertEqual(Serpent.decrypt(legacy.to01()), message)
+        self.assertTrue(Serpent.encrypt(message).startswith("serpent1:ecb:"))
+
+    def test_serpent_batch(self):
+        key = SerpentCipher.keyGen()
+        scalar = SerpentCipher(key, engine="int")
+        batch = SerpentCipher(key, engine="numpy")
+        blocks = SerpentCipher.splitPlainTextToBlocks("Hello World! " * 20)
+        encrypted_blocks = batch.encryptBlockList(blocks)
+        self.assertEqual(encrypted_blocks, scalar.encryptBlockList(blocks))
+        self.assertEqual(batch.decryptBlockList(encrypted_blocks), blocks)
+
+    def test_serpent_stream(self):
+        Serpent = SerpentCipher(SerpentCipher.keyGen())
+        for data in [b"", b"\x00" * 48, bytes(range(256)) * 3 + b"\x00"]:
+            encrypted = io.BytesIO()
+            Serpent.encrypt_stream(io.BytesIO(data), encrypted, chunk_size=20)
+            self.assertEqual(encrypted.getvalue(), Serpent.encrypt_bytes(data))
+
+            decrypted = io.BytesIO()
+            Serpent.decrypt_stream(iter([encrypted.getvalue()[:7], encrypted.getvalue()[7:]]), decrypted)
+            self.assertEqual(decrypted.getvalue(), data)
+
+    def test_serpent_ctr(self):
+        Serpent = SerpentCipher(SerpentCipher.keyGen(), mode="ctr")
+        message = "Hello World! " * 5
+        encrypted_message = Serpent.encrypt(message)
+        self.assertTrue(encrypted_message.startswith("serpent1:ctr:"))
+        self.assertNotEqual(Serpent.encrypt(message), encrypted_message)
+        self.assertEqual(SerpentCipher(Serpent.key).decrypt(encrypted_message), message)
+
+        encrypted = io.BytesIO()
+        Serpent.encrypt_stream(io.BytesIO(message.encode()), encrypted, chunk_size=7)
+        decrypted = io.BytesIO()
+        Serpent.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted, chunk_size=5)
+        self.assertEqual(decrypted.getvalue(), message.encode())
+
+    def test_serpent_cbc(self):
+        Serpent = SerpentCipher(SerpentCipher.keyGen(), mode="cbc")
+        for data in [b"", b"\x00" * 48, bytes(range(256)) * 3 + b"\x00"]:
+            encrypted_data = Serpent.encrypt_bytes(data)
+            self.assertEqual(SerpentCipher(Serpent.key).decrypt_bytes(encrypted_data, mode="cbc"), data)
+
+            decrypted = io.BytesIO()
+            Serpent.decrypt_stream(io.BytesIO(encrypted_data), decrypted, chunk_size=20)
+            self.assertEqual(decrypted.getvalue(), data)
+
+        encrypted = io.BytesIO()
+        Serpent.encrypt_stream(io.BytesIO(data), encrypted, chunk_size=20)
+        self.assertEqual(Serpent.decrypt_bytes(encrypted.getvalue()), data)
+
+    def test_serpent_decrypt_range(self):
+        Serpent = SerpentCipher(SerpentCipher.keyGen(), mode="ctr")
+        data = bytes(range(256)) * 2
+        encrypted_data = Serpent.encrypt_bytes(data)
+        for offset, length in [(0, 10), (15, 2), (100, 200), (500, 100)]:
+            self.assertEqual(Serpent.decrypt_range(encrypted_data, offset, length), data[offset:offset+length])
+            self.assertEqual(Serpent.decrypt_range(io.BytesIO(encrypted_data), offset, length), data[offset:offset+length])
+        self.assertEqual(Serpent.decrypt_range(SerpentCipher.encodeCiphertext(encrypted_data, "ctr"), 3, 5), data[3:8])
+
+    def test_serpent_parallel(self):
+        threshold = SerpentCipher.PARALLEL_THRESHOLD
+        SerpentCipher.configurePool(workers=2, threshold=0)
+        try:
+            key = SerpentCipher.keyGen()
+            data = bytes(range(256)) * 4
+            parallel = SerpentCipher(key, parallel=True)
+            self.assertEqual(parallel.encrypt_bytes(data), SerpentCipher(key).encrypt_bytes(data))
+            parallel = SerpentCipher(key, mode="ctr", parallel=True)
+            self.assertEqual(parallel.decrypt_bytes(parallel.encrypt_bytes(data)), data)
+        finally:
+            SerpentCipher.configurePool(threshold=threshold)
+
 
 class TestHash(unittest.TestCase):
 
@@ -164,6 +332,114 @@ class TestHash(unittest.TestCase):
     def test_hmac_sha256_1(self):
         self.assertEqual(hmac_sha256(b"admin", b"gs15"), "0af840f4ce055536ff9919d1016f880c9112f356d46a69c5f2ca4e92bfbe7f2c")
 
+    def test_hash_backends(self):
+        backend = Hash.get_backend()
+        try:
+            for name in Hash.BACKENDS:
+                Hash.set_backend(name)
+                self.assertTrue(Hash.self_test(name))
+                self.assertEqual(sha256(b"admin"), "8c6976e5b5410415bde908bd4dee15dfb167a9c873fc4bb8a81f6f2ab448a918")
+                self.assertEqual(hmac_sha256(b"admin", b"gs15"), "0af840f4ce055536ff9919d1016f880c9112f356d46a69c5f2ca4e92bfbe7f2c")
+        finally:
+            Hash.set_backend(backend)
+        self.assertRaises(ValueError, Hash.set_backend, "unknown")
+
+    def test_sha256_incremental(self):
+        message = bytes(range(256)) * 5
+        hash = Hash.SHA256()
+        for i in range(0, len(message), 100):
+            hash.update(message[i:i+100])
+        self.assertEqual(hash.hexdigest(), Hash.sha256_reference(message))
+
+        prefix = Hash.SHA256(b"admin")
+        copy = prefix.copy()
+        copy.update(b"gs15")
+        self.assertEqual(prefix.hexdigest(), "8c6976e5b5410415bde908bd4dee15dfb167a9c873fc4bb8a81f6f2ab448a918")
+        self.assertEqual(copy.hexdigest(), Hash.sha256_reference(b"admings15"))
+
+    def test_hmac_incremental(self):
+        mac = Hash.HMAC(b"admin", digestmod=Hash.SHA256)
+        copy = mac.copy()
+        copy.update(b"gs15")
+        self.assertEqual(copy.hexdigest(), "0af840f4ce055536ff9919d1016f880c9112f356d46a69c5f2ca4e92bfbe7f2c")
+        mac.update(b"admin")
+        self.assertEqual(mac.hexdigest(), hmac_sha256(b"admin", b"admin"))
+
+    def test_sha256_many(self):
+        messages = [bytes(range(length % 256)) * (length // 256 + 1) for length in range(0, 300, 7)]
+        expected = [Hash.SHA256(message).hexdigest() for message in messages]
+        backend = Hash.get_backend()
+        try:
+            for name in Hash.BACKENDS:
+                Hash.set_backend(name)
+                self.assertEqual(Hash.sha256_many(messages), expected)
+        finally:
+            Hash.set_backend(backend)
+        self.assertEqual(Hash.sha256_many([]), [])
+
+class TestProcessPool(unittest.TestCase):
+    def test_shards(self):
+        self.assertEqual(ProcessPool.shards(list(range(10)), 3), [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertEqual(ProcessPool.shards(bytes(48), 2, align=16), [bytes(32), bytes(16)])
+        self.assertEqual(ProcessPool.shards([], 4), [])
+
+    def test_map_shards(self):
+        pool = ProcessPool.get_pool()
+        self.assertEqual(ProcessPool.map_shards(sorted, [3, 1, 2, 6, 5, 4], count=2), [[1, 2, 3], [4, 5, 6]])
+        # The pool is shared between the calls
+        self.assertIs(ProcessPool.get_pool(), pool)
+
+    def test_search(self):
+        with ProcessPool.search() as stop:
+            self.assertFalse(stop.is_set())
+        self.assertTrue(ProcessPool.stop.is_set())
+
+class TestKeyPool(unittest.TestCase):
+
+    def test_key_pool(self):
+        with tempfile.TemporaryDirectory() as path:
+            spool = os.path.join(path, "pool")
+            pool = KeyPool(spool, size=3, low_water=1)
+            self.assertIsNone(pool.take())
+            pool.wait()
+            self.assertEqual(len(pool), 3)
+            self.assertEqual(os.stat(os.path.join(spool, "spool.key")).st_mode & 0o777, 0o600)
+
+            # One encrypted entry per key pair
+            entries = {}
+            for name in pool.entries():
+                with open(os.path.join(spool, name), "r") as f:
+                    entries[name] = f.read()
+                self.assertTrue(entries[name].startswith("serpent1:cbc:"))
+            first = pool.entries()[0]
+            stored = [tuple(map(tuple, json.loads(pool.cipher.decrypt(entries[name])))) for name in pool.entries()]
+
+            # take() only claims the oldest entry, the others are left as they are
+            restored = KeyPool(spool, size=3, low_water=1)
+            keys = restored.take()
+            self.assertEqual(keys, stored[0])
+            self.assertEqual(pool.entries(), sorted(set(entries) - {first}))
+            for name in pool.entries():
+                with open(os.path.join(spool, name), "r") as f:
+                    self.assertEqual(f.read(), entries[name])
+
+            User.key_pool = restored
+            try:
+                self.assertEqual(User.create_user("KeyPoolTest"), stored[1])
+            finally:
+                User.key_pool = None
+            self.assertEqual(User("KeyPoolTest").getPublicKey(), stored[1][0])
+            User.delete_user("KeyPoolTest")
+
+            # The other pool never gives a key pair taken by the first one
+            self.assertEqual(pool.take(), stored[2])
+            restored.wait()
+            pool.wait()
+            self.assertEqual(len(pool), 3)
+            for name in pool.entries():
+                with open(os.path.join(spool, name), "r") as f:
+                    self.assertNotIn(tuple(map(tuple, json.loads(pool.cipher.decrypt(f.read())))), stored)
+
 class TestCertificateAuthority(unittest.TestCase):
 
     def test_certificate_authority(self):
@@ -189,6 +465,34 @@ class TestCertificateAuthority(unittest.TestCase):
 
         User.delete_user("CertificateTest")
 
+    def test_verify_many(self):
+        with open("src/tools/keys/authority.json", "r") as f:
+            authority_keys = json.load(f)
+        with open("src/tools/keys/certificates.json", "r") as f:
+            saved_certificates = f.read()
+
+        Authority = CertificateAuthority(authority_keys['public'], authority_keys['private'])
+        try:
+            certificates = {}
+            for i in range(5):
+                certificates[f"Entity{i}"] = Authority.create_certificate((1000 + i, 65537), f"Entity{i}", None)
+        finally:
+            with open("src/tools/keys/certificates.json", "w") as f:
+                f.write(saved_certificates)
+
+        certificates["Entity3"] = dict(certificates["Entity3"], entity_public_key=(999, 65537))
+        certificates["Broken"] = {'entity_name': "Broken"}
+
+        expected = {name: Authority.verify_certificate(certificate) for name, certificate in certificates.items() if name != "Broken"}
+        expected["Broken"] = False
+        self.assertEqual(expected["Entity3"], False)
+
+        for workers in (None, 2):
+            report = Authority.verify_many(certificates, workers=workers)
+            self.assertEqual(report['results'], expected)
+            self.assertGreaterEqual(report['seconds'], 0)
+        self.assertEqual(set(Authority.verify_many()['results']), set(json.loads(saved_certificates)))
+
 
 class TestUser(unittest.TestCase):
 
@@ -218,6 +522,41 @@ class TestKDF(unittest.TestCase):
 
             self.assertEqual(message, decrypted_message)
 
+    def test_kdf_seek(self):
+        kdf = KDF("chain_key", "salt", 256)
+        for _ in range(5):
+            kdf.derive()
+
+        checkpoint = KDF("chain_key", "salt", 256)
+        checkpoint.seek(kdf.chain_key, kdf.iteration)
+        self.assertEqual(checkpoint.derive(), kdf.derive())
+
+        restored = KDF(kdf.chain_key, "salt", 256, iteration=kdf.iteration)
+        self.assertEqual(restored.derive(), kdf.derive())
+
+    def test_kdf_hmac_context(self):
+        kdf = KDF("chain_key", "salt", 256, iteration=7)
+        message_key = hmac_sha256(b"chain_key", b"chain_keysalt7")
+        chain_key = hmac_sha256(b"chain_key", b"saltchain_key7")
+
+        bt = bitarray.bitarray()
+        bt.frombytes(message_key.encode())
+        KDF.cache.clear()
+        self.assertEqual(kdf.derive(), bt.to01()[:256])
+        self.assertEqual(kdf.chain_key, chain_key)
+
+    def test_kdf_checkpoints(self):
+        checkpoints = KDFCheckpoints(interval=4)
+        self.assertFalse(checkpoints.is_due(0))
+        self.assertTrue(checkpoints.is_due(8))
+        self.assertEqual(checkpoints.nearest(3), None)
+
+        checkpoints.add(8, "key8")
+        checkpoints.add(4, "key4")
+        checkpoints = KDFCheckpoints(json.loads(json.dumps(checkpoints.to_dict())), interval=4)
+        self.assertEqual(checkpoints.nearest(7), (4, "key4"))
+        self.assertEqual(checkpoints.nearest(8), (8, "key8"))
+
 
 class TestConversation(unittest.TestCase):
     
@@ -240,10 +579,49 @@ class TestConversation(unittest.TestCase):
 
         self.assertEqual(Bob.get_messages_conversation()[0]['message'], "Hello World!")
 
+        Bob.send_message_conversation("Hello Alice!")
+        Alice.send_message_conversation("Hello Bob!")
+
+        with open("src/tools/conversations/BobTest.json", "r") as f:
+            self.assertEqual(json.load(f)["AliceTest"]['ratchet']['iteration'], 3)
+
+        bob_conversation = Conversation(Bob, Alice)
+        self.assertEqual(bob_conversation.kfd.iteration, 3)
+        Bob.setConversation(bob_conversation)
+        self.assertEqual([message['message'] for message in Bob.get_messages_conversation()], ["Hello World!", "Hello Alice!", "Hello Bob!"])
+
         User.delete_user("AliceTest")
         User.delete_user("BobTest")
 
 
+    def test_conversation_window(self):
+        User.create_user("AliceTest")
+        User.create_user("BobTest")
+        Alice = User("AliceTest")
+        Bob = User("BobTest")
+
+        interval = KDFCheckpoints.INTERVAL
+        KDFCheckpoints.INTERVAL = 2
+        try:
+            Conversation.create_conversation(Alice, Bob, "chain_key", "salt")
+            Alice.setConversation(Conversation(Alice, Bob))
+            for i in range(5):
+                Alice.send_message_conversation(f"Message {i}")
+
+            with open("src/tools/conversations/BobTest.json", "r") as f:
+                record = json.load(f)["AliceTest"]
+            self.assertEqual(sorted(record['checkpoints']), ["2", "4"])
+
+            Bob.setConversation(Conversation(Bob, Alice))
+            messages = Bob.get_messages_conversation(3, 5)
+            self.assertEqual([message['message'] for message in messages], ["Message 3", "Message 4"])
+            self.assertEqual(len(Bob.get_messages_conversation()), 5)
+        finally:
+            KDFCheckpoints.INTERVAL = interval
+            User.delete_user("AliceTest")
+            User.delete_user("BobTest")
+
+
 class TestProofOfKnowledge(unittest.TestCase):
 
     def test_proof_of_knowledge_valid(self):
@@ -302,6 +680,148 @@ class TestBlockChain(unittest.TestCase):
         blockchain.add_block("Alice", "Hello")
 
         self.assertEqual(blockchain.get_latest_block().data, "Hello")
+
+    def test_parallel_proof_of_work(self):
+        blockchain = Blockchain()
+        blockchain.add_block("Alice", "Hello", workers=2)
+
+        block = blockchain.get_latest_block()
+        self.assertEqual(block.hash, block.calculate_hash())
+        self.assertTrue(block.hash.startswith("00"))
+        self.assertEqual(block.previous_hash, blockchain.chain[0].hash)
+
+        # Mined inline below PARALLEL_DIFFICULTY
+        self.assertEqual(blockchain.last_mining_stats['workers'], 1)
+        self.assertGreater(blockchain.last_mining_stats['hashes'], 0)
+
+        difficulty = Blockchain.PARALLEL_DIFFICULTY
+        block = blockchain.proof_of_work(Block(2, 0, "Bob", "World", block.hash), difficulty=difficulty, workers=2)
+        self.assertEqual(block.hash, block.calculate_hash())
+        self.assertTrue(block.hash.startswith("0" * difficulty))
+        self.assertEqual(blockchain.last_mining_stats['workers'], 2)
+
+    def test_block_midstate(self):
+        block = Block(1, 0, "Alice", "Hello" * 1000, "0", nonce=42)
+        self.assertEqual(block.hash, sha256(block.prefix() + b"42"))
+        block.nonce = 43
+        self.assertEqual(block.calculate_hash(), sha256(block.prefix() + b"43"))
+        block.data = "World"
+        self.assertEqual(block.calculate_hash(), sha256(b"10AliceWorld043"))
+
+    def test_block_store(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = BlockStore(path, sync_interval=2)
+            blockchain = Blockchain(store=store)
+            blockchain.add_block("Alice", "Hello")
+            blockchain.add_block("Bob", "World")
+            hashes = [block.hash for block in blockchain.blocks()]
+            store.close()
+
+            # Torn write at the end of the segment
+            with open(os.path.join(path, "segment-000000.log"), "ab") as f:
+                f.write(b"\x00\x00\x01\x00{")
+
+            store = BlockStore(path)
+            blockchain = Blockchain(store=store)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(blockchain.chain[0].hash, hashes[-1])
+            self.assertEqual(store.find(hashes[1])['data'], "Hello")
+
+            blockchain.add_block("Alice", "Again")
+            self.assertEqual([block.index for block in blockchain.blocks()], [0, 1, 2, 3])
+            self.assertEqual(blockchain.get_latest_block().previous_hash, hashes[-1])
+            _, segment, offset, length, _ = store.entry(3)
+            store.close()
+
+            # Index entry flushed but record lost before the fsync
+            with open(os.path.join(path, "segment-000000.log"), "r+b") as f:
+                f.seek(offset)
+                f.write(b"\x00" * length)
+
+            store = BlockStore(path)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.tail()['hash'], hashes[-1])
+            self.assertIsNone(store.find(blockchain.get_latest_block().hash))
+
+            # The checkpoint key is kept with the store
+            self.assertTrue(Blockchain(store=store).verify())
+            self.assertEqual(os.stat(os.path.join(path, "checkpoint.key")).st_mode & 0o777, 0o600)
+            store.close()
+            store = BlockStore(path)
+            blockchain = Blockchain(store=store)
+            self.assertTrue(blockchain.verify(since=blockchain.checkpoint))
+            store.close()
+
+    def test_verify(self):
+        blockchain = Blockchain()
+        for data in ("Hello", "World", "Again"):
+            blockchain.add_block("Alice", data)
+
+        self.assertTrue(blockchain.verify())
+        checkpoint = blockchain.checkpoint
+        self.assertEqual(checkpoint['height'], 3)
+
+        blockchain.add_block("Bob", "New")
+        threshold = Blockchain.PARALLEL_VERIFY_BLOCKS
+        Blockchain.PARALLEL_VERIFY_BLOCKS = 1
+        try:
+            self.assertTrue(blockchain.verify(since=checkpoint, workers=2))
+            self.assertEqual(blockchain.checkpoint['height'], 4)
+
+            # Changes before the checkpoint are not verified again
+            blockchain.chain[1].data = "Tampered"
+            self.assertTrue(blockchain.verify(since=blockchain.checkpoint))
+            self.assertFalse(blockchain.verify())
+            self.assertFalse(blockchain.verify(workers=2))
+        finally:
+            Blockchain.PARALLEL_VERIFY_BLOCKS = threshold
+
+        # A checkpoint cannot be forged without the key
+        self.assertFalse(blockchain.verify(since=dict(checkpoint, height=2)))
+        block = blockchain.chain[2]
+        forged = {'height': 2, 'hash': block.hash, 'digest': sha256(f"2:{block.hash}".encode())}
+        self.assertFalse(blockchain.verify(since=forged))
+        self.assertFalse(Blockchain().verify(since=checkpoint))
+
+    def test_chunk_store(self):
+        with tempfile.TemporaryDirectory() as path:
+            chunks = ChunkStore(path, chunk_size=16)
+            blockchain = Blockchain(chunks=chunks)
+
+            document = b"0123456789abcdef" * 3 + b"end"
+            root = blockchain.add_document("Alice", document)
+            self.assertEqual(blockchain.add_document("Bob", document), root)
+            self.assertEqual(len(os.listdir(os.path.join(path, "manifests"))), 1)
+            self.assertEqual(sum(len(files) for _, _, files in os.walk(os.path.join(path, "chunks"))), 2)
+
+            block = blockchain.get_latest_block()
+            self.assertEqual(block.data, {'merkle_root': root, 'size': len(document)})
+            self.assertEqual(blockchain.get_document(block), document)
+            self.assertEqual(blockchain.get_document(blockchain.chain[0]), "Genesis Block")
+            self.assertTrue(blockchain.verify())
+
+            leaves = [bytes.fromhex(sha256(b"\x00" + chunk)) for chunk in (b"0123456789abcdef", b"end")]
+            nodes = [bytes.fromhex(sha256(b"\x01" + leaves[0] * 2)), bytes.fromhex(sha256(b"\x01" + leaves[0] + leaves[1]))]
+            top = sha256(b"\x01" + nodes[0] + nodes[1])
+            self.assertEqual(root, sha256(b"\x02" + len(document).to_bytes(8, "big") + bytes.fromhex(top)))
+
+    def test_chunk_store_collisions(self):
+        with tempfile.TemporaryDirectory() as path:
+            chunks = ChunkStore(path, chunk_size=16)
+            a, b, c = b"a" * 16, b"b" * 16, b"c" * 16
+
+            # An odd last chunk is not duplicated
+            root = chunks.put(a + b + c)
+            self.assertNotEqual(chunks.put(a + b + c + c), root)
+            self.assertEqual(chunks.get(root), a + b + c)
+            self.assertEqual(chunks.get(chunks.put(a + b + c + c)), a + b + c + c)
+
+            # A chunk holding two hashes is not a node
+            x, y = ChunkStore.leaf_hashes([a, b])
+            forged = bytes.fromhex(x) + bytes.fromhex(y)
+            chunks = ChunkStore(path, chunk_size=32)
+            self.assertNotEqual(chunks.put(forged), ChunkStore(path, chunk_size=16).put(a + b))
+            self.assertEqual(chunks.get(chunks.put(forged)), forged)
         
 
 if __name__ == "__main__":
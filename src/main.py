@@ -5,7 +5,11 @@ from tools.User import *
 from tools.KDF import *
 from tools.ModularMath import *
 from tools.BlockChain import *
+from tools.BlockStore import *
+from tools.ChunkStore import *
+from tools.KeyPool import *
 import logging
+import os
 import json
 
 
@@ -193,7 +197,11 @@ if __name__ == "__main__":
 
     else:
         current_user = None
-        blockchain = Blockchain()
+        User.key_pool = KeyPool("src/tools/keys/pool")
+        User.key_pool.start()
+        blockchain = Blockchain(store=BlockStore("src/tools/blockchain"), chunks=ChunkStore("src/tools/blockchain/documents"))
+        if not blockchain.verify(since=blockchain.checkpoint, workers=os.cpu_count()):
+            print("The blockchain is corrupted")
 
         for line in logo:
             print(line)
@@ -401,7 +409,8 @@ if __name__ == "__main__":
                         print("Please select a user")
                         continue
 
-                    blockchain.add_block(current_user.getUsername(), input("Document > "))
+                    blockchain.add_document(current_user.getUsername(), input("Document > "))
+                    print(f"Mined in {blockchain.last_mining_stats['seconds']:.2f}s ({blockchain.last_mining_stats['hashes_per_second']:.0f} hashes/s)")
 
                     blockchain.print()
 
@@ -409,6 +418,7 @@ if __name__ == "__main__":
 
                 case "13":
                     print("Exit")
+                    blockchain.store.close()
                     exit()
 
    
@@ -1,9 +1,73 @@
-from tools.Hash import sha256
+from tools import Hash
+from tools import ProcessPool
+import concurrent.futures
+import hmac
+import os
 import time
-import random
-import string
+
+# Nonces tried between two checks of the stop event
+CHECK_INTERVAL = 4096
+
+
+def mine(prefix, difficulty, first=0, step=1, stop=None):
+    """
+    Searches a nonce for a block
+    Tries the nonces first, first + step, first + 2 * step, ... so that
+    processes started with different first values never try the same nonce.
+    The prefix is absorbed once, only the nonce is hashed for each attempt.
+    :param prefix: bytes of the block without the nonce
+    :param difficulty: number of leading zeros of the hash
+    :param first: first nonce
+    :param step: gap between two nonces
+    :param stop: event ending the search when set, e.g. by another process (optional)
+    :return: (nonce, hash, number of hashes), nonce and hash are None if stopped
+    """
+    target = "0" * difficulty
+    midstate = Hash.new(prefix)
+    nonce = first
+    hashes = 0
+    while True:
+        for _ in range(CHECK_INTERVAL):
+            state = midstate.copy()
+            state.update(str(nonce).encode())
+            hash = state.hexdigest()
+            hashes += 1
+            if hash[:difficulty] == target:
+                return nonce, hash, hashes
+            nonce += step
+        if stop is not None and stop.is_set():
+            return None, None, hashes
+
+
+def mine_worker(prefix, difficulty, first, step):
+    """
+    Process pool task of Blockchain.parallel_proof_of_work()
+    :return: see mine()
+    """
+    return mine(prefix, difficulty, first, step, stop=ProcessPool.stop)
+
+
+def check_hashes(blocks, difficulty):
+    """
+    Recomputes the hashes of blocks and checks their proof of work
+    The genesis block has no proof of work
+    :param blocks: list of dict of blocks
+    :param difficulty: number of leading zeros of the hashes
+    :return: True if all the blocks are valid
+    """
+    for block in blocks:
+        restored = Block.from_dict(block)
+        if restored.calculate_hash() != restored.hash:
+            return False
+        if restored.index != 0 and restored.hash[:difficulty] != "0" * difficulty:
+            return False
+    return True
+
 
 class Block:
+    # Fields of the hashed prefix, changing one of them invalidates the midstate
+    PREFIX_FIELDS = ("index", "timestamp", "user", "data", "previous_hash")
+
     def __init__(self, index, timestamp, user, data, previous_hash, nonce=0):
         self.index = index
         self.timestamp = timestamp
@@ -13,13 +77,82 @@ class Block:
         self.nonce = nonce
         self.hash = self.calculate_hash()
 
+    def __setattr__(self, name, value):
+        if name in Block.PREFIX_FIELDS:
+            self.__dict__['_midstate'] = None
+        super().__setattr__(name, value)
+
+    def prefix(self):
+        """
+        Hashed content of the block without the nonce
+        :return: bytes
+        """
+        return (str(self.index) + str(self.timestamp) + str(self.user) + str(self.data) + str(self.previous_hash)).encode()
+
+    def midstate(self):
+        """
+        SHA-256 state after the prefix, computed once for all the nonces
+        :return: incremental SHA-256 object
+        """
+        if self.__dict__.get('_midstate') is None:
+            self.__dict__['_midstate'] = Hash.new(self.prefix())
+        return self._midstate
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'timestamp': self.timestamp,
+            'user': self.user,
+            'data': self.data,
+            'previous_hash': self.previous_hash,
+            'nonce': self.nonce,
+            'hash': self.hash
+        }
+
+    @staticmethod
+    def from_dict(block):
+        """
+        Rebuilds a block, the saved hash is kept as is
+        :param block: dict of the block
+        :return: Block
+        """
+        restored = Block.__new__(Block)
+        for name, value in block.items():
+            setattr(restored, name, value)
+        return restored
+
     def calculate_hash(self):
-        data_str = str(self.index) + str(self.timestamp) + str(self.user) + str(self.data) + str(self.previous_hash) + str(self.nonce)
-        return sha256(data_str.encode())
+        state = self.midstate().copy()
+        state.update(str(self.nonce).encode())
+        return state.hexdigest()
 
 class Blockchain:
-    def __init__(self):
-        self.chain = [self.create_genesis_block()]
+    # Difficulty from which the nonce search is worth a process pool,
+    # below it the search is shorter than starting the processes
+    PARALLEL_DIFFICULTY = 4
+
+    # Number of blocks from which verify() recomputes the hashes in a process pool
+    PARALLEL_VERIFY_BLOCKS = 4096
+
+    def __init__(self, store=None, chunks=None):
+        """
+        :param store: BlockStore where the blocks are saved, only the last one is loaded (optional)
+        :param chunks: ChunkStore where the documents are saved (optional)
+        """
+        self.store = store
+        self.chunks = chunks
+        self.last_mining_stats = None
+        self.checkpoint = store.load_checkpoint() if store is not None else None
+
+        # Secret of the checkpoint HMAC, kept with the store or only for this instance
+        self.checkpoint_key = store.checkpoint_key() if store is not None else os.urandom(32)
+
+        if store is not None and len(store):
+            self.chain = [Block.from_dict(store.tail())]
+        else:
+            self.chain = [self.create_genesis_block()]
+            if store is not None:
+                store.append(self.chain[0].to_dict())
 
     def create_genesis_block(self):
         return Block(0, time.time(), "GS15", "Genesis Block", "0")
@@ -27,23 +160,171 @@ class Blockchain:
     def get_latest_block(self):
         return self.chain[-1]
 
-    def add_block(self, user, data):
+    def add_block(self, user, data, workers=None):
         latest_block = self.get_latest_block()
-        new_block = Block(len(self.chain), time.time(), user, data, latest_block.hash)
+        new_block = Block(latest_block.index + 1, time.time(), user, data, latest_block.hash)
 
         # Proof of Work
-        new_block = self.proof_of_work(new_block)
+        new_block = self.proof_of_work(new_block, workers=workers)
 
         self.chain.append(new_block)
+        if self.store is not None:
+            self.store.append(new_block.to_dict())
+
+    def add_document(self, user, document, workers=None):
+        """
+        Saves a document in the chunk store, the block only references its Merkle root
+        :param user: The user
+        :param document: The document, str or bytes
+        :param workers: The number of mining processes (optional)
+        :return: The Merkle root of the document
+        """
+        if isinstance(document, str):
+            document = document.encode()
+        root = self.chunks.put(document)
+        self.add_block(user, {'merkle_root': root, 'size': len(document)}, workers=workers)
+        return root
+
+    def get_document(self, block):
+        """
+        Gets the document of a block
+        :param block: The block
+        :return: The document, bytes if saved in the chunk store
+        """
+        if isinstance(block.data, dict) and 'merkle_root' in block.data:
+            return self.chunks.get(block.data['merkle_root'])
+        return block.data
+
+    def blocks(self, start=0):
+        """
+        Iterates over all the blocks, from the store if there is one
+        :param start: index of the first block (optional)
+        :return: iterator of Block
+        """
+        if self.store is None:
+            return iter(self.chain[start:])
+        return (Block.from_dict(self.store.get(i)) for i in range(start, len(self.store)))
+
+    def checkpoint_digest(self, height, hash):
+        """
+        HMAC of a checkpoint under checkpoint_key
+        Without the key, an edited checkpoint or chain cannot get a valid digest
+        :param height: index of the last verified block
+        :param hash: hash of the last verified block
+        :return: hex digest
+        """
+        return Hash.hmac_sha256(self.checkpoint_key, f"{height}:{hash}".encode())
+
+    def make_checkpoint(self, block):
+        """
+        Checkpoint of the chain verified up to a block
+        :param block: The last verified block
+        :return: dict with the height, the hash of the block and an HMAC of both
+        """
+        return {
+            'height': block.index,
+            'hash': block.hash,
+            'digest': self.checkpoint_digest(block.index, block.hash)
+        }
+
+    def verify(self, since=None, difficulty=2, workers=None):
+        """
+        Verifies the chain: links between blocks, hashes and proofs of work
+        Only the blocks after the checkpoint are verified, the new checkpoint is
+        saved in self.checkpoint and in the store
+        :param since: checkpoint of a previous verification (optional)
+        :param difficulty: The number of leading zeros of the hashes (optional)
+        :param workers: The number of shards on the shared process pool, only used from PARALLEL_VERIFY_BLOCKS (optional)
+        :return: True if the chain is valid
+        """
+        start = 0
+        previous = None
+        if since is not None:
+            if not hmac.compare_digest(since['digest'], self.checkpoint_digest(since['height'], since['hash'])):
+                return False
+            previous = next(self.blocks(since['height']), None)
+            if previous is None or previous.hash != since['hash']:
+                return False
+            start = since['height'] + 1
+
+        blocks = [block.to_dict() for block in self.blocks(start)]
 
-    def proof_of_work(self, block, difficulty=2):
-        while block.hash[:difficulty] != "0" * difficulty:
-            block.nonce = "".join([random.choice(string.ascii_letters) for _ in range(32)])
-            block.hash = block.calculate_hash()
+        # Links, the hashes only depend on the stored previous_hash
+        for block in blocks:
+            if previous is not None and (block['index'] != previous.index + 1 or block['previous_hash'] != previous.hash):
+                return False
+            previous = Block.from_dict(block)
+
+        if workers and workers > 1 and len(blocks) >= Blockchain.PARALLEL_VERIFY_BLOCKS:
+            valid = all(ProcessPool.map_shards(check_hashes, blocks, difficulty, count=workers))
+        else:
+            valid = check_hashes(blocks, difficulty)
+
+        if not valid or previous is None:
+            return False
+
+        self.checkpoint = self.make_checkpoint(previous)
+        if self.store is not None:
+            self.store.save_checkpoint(self.checkpoint)
+        return True
+
+    def proof_of_work(self, block, difficulty=2, workers=None):
+        """
+        Searches a nonce giving a hash starting with difficulty zeros
+        The stats of the search are saved in last_mining_stats
+        :param block: The block
+        :param difficulty: The number of leading zeros (optional)
+        :param workers: The number of searches on the shared process pool, only used from PARALLEL_DIFFICULTY (optional)
+        :return: The block
+        """
+        start = time.perf_counter()
+        prefix = block.prefix()
+        workers = workers or 1
+        if difficulty < Blockchain.PARALLEL_DIFFICULTY:
+            workers = 1
+
+        if workers == 1:
+            nonce, hash, hashes = mine(prefix, difficulty)
+        else:
+            nonce, hash, hashes = self.parallel_proof_of_work(prefix, difficulty, workers)
+
+        block.nonce = nonce
+        block.hash = hash
+
+        seconds = time.perf_counter() - start
+        self.last_mining_stats = {
+            'workers': workers,
+            'hashes': hashes,
+            'seconds': seconds,
+            'hashes_per_second': hashes / seconds if seconds > 0 else float("inf")
+        }
         return block
 
+    @staticmethod
+    def parallel_proof_of_work(prefix, difficulty, workers):
+        """
+        Searches a nonce on the shared process pool
+        Each search tries its own nonces, all stop as soon as one is found
+        :param prefix: bytes of the block without the nonce
+        :param difficulty: The number of leading zeros
+        :param workers: The number of searches
+        :return: (nonce, hash, number of hashes of all searches)
+        """
+        found = None
+        hashes = 0
+        with ProcessPool.search() as stop:
+            pool = ProcessPool.get_pool()
+            futures = [pool.submit(mine_worker, prefix, difficulty, first, workers) for first in range(workers)]
+            for future in concurrent.futures.as_completed(futures):
+                nonce, hash, count = future.result()
+                hashes += count
+                if nonce is not None and found is None:
+                    found = (nonce, hash)
+                    stop.set()
+        return found[0], found[1], hashes
+
     def print(self):
-        for block in self.chain:
+        for block in self.blocks():
             print(f"Index: {block.index}")
             print(f"Timestamp: {block.timestamp}")
             print(f"User: {block.user}")
@@ -51,4 +332,4 @@ class Blockchain:
             print(f"Previous Hash: {block.previous_hash}")
             print(f"Nonce: {block.nonce}")
             print(f"Hash: {block.hash}")
-            print("-" * 30)
\ No newline at end of file
+            print("-" * 30)
@@ -0,0 +1,250 @@
+import json
+import os
+import struct
+import zlib
+
+class BlockStore():
+    """
+    Append-only storage of the blocks of a blockchain
+    The blocks are written in segment files as records of a 4 bytes length and
+    a CRC32 followed by the JSON of the block. The index file has one fixed size
+    entry per block: index, segment, offset, length and hash of the block.
+    """
+
+    # Header of the records of the segments: payload length, CRC32 of the payload
+    RECORD_HEADER = struct.Struct(">II")
+
+    # Entry of the index: block index, segment, offset, record length, block hash
+    INDEX_ENTRY = struct.Struct(">QIQI32s")
+
+    # Size from which a new segment is started
+    SEGMENT_SIZE = 16 * 1024 * 1024
+
+    # Number of appends between two fsync
+    SYNC_INTERVAL = 32
+
+    def __init__(self, path, sync_interval=None):
+        """
+        Opens the store, a torn write at the end of the files is discarded
+        :param path: directory of the store
+        :param sync_interval: number of appends between two fsync (optional)
+        """
+        self.path = path
+        self.sync_interval = sync_interval or BlockStore.SYNC_INTERVAL
+        self.pending = 0
+        self.segment_number = None
+        os.makedirs(path, exist_ok=True)
+
+        self.index = open(os.path.join(path, "index.bin"), "a+b")
+        self.recover()
+
+        # Position of the blocks by hash
+        self.index.seek(0)
+        entries = BlockStore.INDEX_ENTRY.iter_unpack(self.index.read(self.index_size))
+        self.positions = {entry[4]: i for i, entry in enumerate(entries)}
+
+        last = self.entry(len(self) - 1) if len(self) else None
+        self.segment_number = last[1] if last else 0
+        self.segment = open(self.segment_path(self.segment_number), "a+b")
+
+    def __len__(self):
+        return self.index_size // BlockStore.INDEX_ENTRY.size
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def segment_path(self, number):
+        return os.path.join(self.path, f"segment-{number:06d}.log")
+
+    def recover(self):
+        """
+        Truncates the index and the last segment after the last complete block
+        A block is complete when its index entry is fully written and its record
+        matches its CRC32. Only the entries appended since the last fsync can be
+        torn, the first damaged one and all the following are dropped.
+        :return: None
+        """
+        self.index.seek(0, os.SEEK_END)
+        size = self.index.tell()
+        self.index_size = size - size % BlockStore.INDEX_ENTRY.size
+
+        first = max(len(self) - max(self.sync_interval, BlockStore.SYNC_INTERVAL), 0)
+        for i in range(first, len(self)):
+            if not self.intact(*self.entry(i)[1:4]):
+                self.index_size = i * BlockStore.INDEX_ENTRY.size
+                break
+
+        self.index.truncate(self.index_size)
+        size = self.index_size
+
+        # Records written after the last index entry
+        if size:
+            _, segment, offset, length, _ = self.entry(len(self) - 1)
+            end = offset + length
+        else:
+            segment, end = 0, 0
+
+        number = segment
+        while os.path.exists(self.segment_path(number)):
+            with open(self.segment_path(number), "r+b") as f:
+                if f.seek(0, os.SEEK_END) > end:
+                    f.truncate(end)
+            number += 1
+            end = 0
+
+    def entry(self, i):
+        """
+        Reads an entry of the index
+        :param i: position of the entry
+        :return: (index, segment, offset, length, hash)
+        """
+        if not 0 <= i < len(self):
+            raise IndexError("Block not in the store")
+        self.index.seek(i * BlockStore.INDEX_ENTRY.size)
+        return BlockStore.INDEX_ENTRY.unpack(self.index.read(BlockStore.INDEX_ENTRY.size))
+
+    def record(self, segment, offset, length):
+        """
+        Reads the payload of a block record
+        :return: bytes, None if the record is incomplete or does not match its CRC32
+        """
+        if segment == self.segment_number:
+            self.segment.flush()
+        try:
+            with open(self.segment_path(segment), "rb") as f:
+                f.seek(offset)
+                record = f.read(length)
+        except FileNotFoundError:
+            return None
+        if len(record) != length or length < BlockStore.RECORD_HEADER.size:
+            return None
+        size, crc = BlockStore.RECORD_HEADER.unpack_from(record)
+        payload = record[BlockStore.RECORD_HEADER.size:]
+        if size != len(payload) or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def intact(self, segment, offset, length):
+        return self.record(segment, offset, length) is not None
+
+    def read(self, segment, offset, length):
+        """
+        Reads a block record
+        :return: dict of the block
+        """
+        payload = self.record(segment, offset, length)
+        if payload is None:
+            raise ValueError("Corrupted block record")
+        return json.loads(payload)
+
+    def get(self, i):
+        """
+        Gets the block at a position
+        :param i: index of the block
+        :return: dict of the block
+        """
+        _, segment, offset, length, _ = self.entry(i)
+        return self.read(segment, offset, length)
+
+    def tail(self):
+        """
+        Gets the last block
+        :return: dict of the block, None if the store is empty
+        """
+        return self.get(len(self) - 1) if len(self) else None
+
+    def find(self, hash):
+        """
+        Gets a block by hash
+        :param hash: hex hash of the block
+        :return: dict of the block, None if not found
+        """
+        i = self.positions.get(bytes.fromhex(hash))
+        return self.get(i) if i is not None else None
+
+    def checkpoint_key(self):
+        """
+        Gets the secret of the checkpoint HMAC, created with mode 0600 if missing
+        :return: bytes
+        """
+        path = os.path.join(self.path, "checkpoint.key")
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            key = os.urandom(32)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(key)
+            return key
+
+    def load_checkpoint(self):
+        """
+        Gets the checkpoint of the last verification
+        :return: dict of the checkpoint, None if the chain was never verified
+        """
+        try:
+            with open(os.path.join(self.path, "checkpoint.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_checkpoint(self, checkpoint):
+        """
+        Saves the checkpoint of a verification, the blocks are synced first
+        :param checkpoint: dict of the checkpoint
+        :return: None
+        """
+        self.sync()
+        path = os.path.join(self.path, "checkpoint.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def append(self, block):
+        """
+        Appends a block, files are synced every sync_interval appends
+        :param block: dict of the block, with index and hash
+        :return: None
+        """
+        payload = json.dumps(block).encode()
+        record = BlockStore.RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        offset = self.segment.seek(0, os.SEEK_END)
+        if offset and offset + len(record) > BlockStore.SEGMENT_SIZE:
+            self.sync()
+            self.segment.close()
+            self.segment_number += 1
+            self.segment = open(self.segment_path(self.segment_number), "a+b")
+            offset = 0
+
+        # The record is written before its index entry, see recover()
+        self.segment.write(record)
+        self.segment.flush()
+        self.index.seek(0, os.SEEK_END)
+        self.index.write(BlockStore.INDEX_ENTRY.pack(block['index'], self.segment_number, offset, len(record), bytes.fromhex(block['hash'])))
+        self.index.flush()
+        self.positions[bytes.fromhex(block['hash'])] = len(self)
+        self.index_size += BlockStore.INDEX_ENTRY.size
+
+        self.pending += 1
+        if self.pending >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """
+        Writes the appended blocks to disk
+        :return: None
+        """
+        for f in (self.segment, self.index):
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.segment.close()
+        self.index.close()
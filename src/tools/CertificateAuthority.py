@@ -1,6 +1,9 @@
 import libnum
-from tools.Hash import sha256
+from tools.Hash import sha256, sha256_many
+from tools.Cipher import RSA
+from tools import ProcessPool
 import json
+import time
 
 class CertificateAuthority:
     def __init__(self, public_key, private_key):
@@ -16,7 +19,7 @@ class CertificateAuthority:
         hashed_data = sha256(certificate_data.encode())
 
         # Sign the hashed data using the CA's private key
-        signature = pow(libnum.s2n(hashed_data), self.private_key[1], self.private_key[0])
+        signature = RSA.privatePow(libnum.s2n(hashed_data), self.private_key)
 
         # Return the certificate
         certificate = {
@@ -55,6 +58,62 @@ class CertificateAuthority:
 
         return is_valid_signature
     
+    def verify_many(self, certificates=None, workers=None):
+        """
+        Verifies many certificates
+        The certificate data is hashed in one batch and the signatures are checked
+        against the CA public key, on the shared process pool if workers is given
+        :param certificates: dict of certificates by entity name, src/tools/keys/certificates.json by default (optional)
+        :param workers: number of shards on the shared process pool (optional)
+        :return: dict with the result of each entity and the time taken in seconds
+        """
+        start = time.perf_counter()
+
+        if certificates is None:
+            try:
+                with open("src/tools/keys/certificates.json", "r") as f:
+                    certificates = json.load(f)
+            except:
+                raise ValueError("No certificates found")
+
+        names = []
+        data = []
+        signatures = []
+        results = {}
+        for name, certificate in certificates.items():
+            try:
+                entity_public_key = certificate['entity_public_key']
+                data.append(f"{certificate['entity_name']}:{entity_public_key[0]}:{entity_public_key[1]}".encode())
+                signatures.append(int(certificate['signature']))
+                names.append(name)
+            except (KeyError, IndexError, TypeError, ValueError):
+                results[name] = False
+
+        items = list(zip(signatures, [libnum.s2n(hashed_data) for hashed_data in sha256_many(data)]))
+
+        if workers and workers > 1 and len(items) > 1:
+            shards = ProcessPool.map_shards(CertificateAuthority.verify_signatures, items, self.public_key, count=workers)
+            valid = [result for shard in shards for result in shard]
+        else:
+            valid = CertificateAuthority.verify_signatures(items, self.public_key)
+
+        results.update(zip(names, valid))
+        return {
+            'results': results,
+            'seconds': time.perf_counter() - start
+        }
+
+    @staticmethod
+    def verify_signatures(items, public_key):
+        """
+        Checks signatures of hashes with a public key
+        :param items: list of (signature, hash as an integer)
+        :param public_key: The CA public key
+        :return: list of booleans
+        """
+        n, e = public_key[0], public_key[1]
+        return [pow(signature, e, n) == hashed_data for signature, hashed_data in items]
+
     @staticmethod
     def getAuthority():
         # Get Certificate Authority from src/tools/keys/authority.json
@@ -0,0 +1,138 @@
+from tools.Hash import sha256, sha256_many
+import json
+import os
+import struct
+
+class ChunkStore():
+    """
+    Content-addressed storage of documents
+    A document is split in fixed size chunks, each chunk is saved once under
+    its leaf hash and the document is identified by the Merkle root of its chunks.
+    Leaves, nodes and the root are hashed with different prefixes, so a node can
+    never be taken for a chunk, and the root also covers the document size.
+    """
+
+    # Prefixes of the hashes of the Merkle tree
+    LEAF = b"\x00"
+    NODE = b"\x01"
+    ROOT = b"\x02"
+
+    # Size of the chunks of the documents
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path, chunk_size=None):
+        """
+        :param path: directory of the store
+        :param chunk_size: size of the chunks in bytes (optional)
+        """
+        self.path = path
+        self.chunk_size = chunk_size or ChunkStore.CHUNK_SIZE
+        os.makedirs(os.path.join(path, "chunks"), exist_ok=True)
+        os.makedirs(os.path.join(path, "manifests"), exist_ok=True)
+
+    @staticmethod
+    def leaf_hashes(chunks):
+        """
+        Leaf hashes of chunks, SHA-256 of LEAF + chunk
+        :param chunks: list of bytes
+        :return: list of hex hashes
+        """
+        return sha256_many([ChunkStore.LEAF + chunk for chunk in chunks])
+
+    @staticmethod
+    def merkle_root(hashes, size):
+        """
+        Merkle root of a document
+        A node is the SHA-256 of NODE + left + right, the last hash of a level is
+        carried up unchanged if alone. The root also covers the document size.
+        :param hashes: list of hex leaf hashes
+        :param size: size of the document in bytes
+        :return: hex hash
+        """
+        level = list(hashes)
+        while len(level) > 1:
+            nodes = sha256_many([ChunkStore.NODE + bytes.fromhex(level[i]) + bytes.fromhex(level[i + 1]) for i in range(0, len(level) - 1, 2)])
+            if len(level) % 2:
+                nodes.append(level[-1])
+            level = nodes
+
+        top = bytes.fromhex(level[0]) if level else b""
+        return sha256(ChunkStore.ROOT + struct.pack(">Q", size) + top)
+
+    def chunk_path(self, hash):
+        return os.path.join(self.path, "chunks", hash[:2], hash[2:])
+
+    def manifest_path(self, root):
+        return os.path.join(self.path, "manifests", root + ".json")
+
+    @staticmethod
+    def write(path, data):
+        """
+        Writes a file atomically
+        :param path: path of the file
+        :param data: bytes
+        :return: None
+        """
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def put(self, document):
+        """
+        Saves a document, chunks already in the store are not written again
+        :param document: bytes
+        :return: Merkle root of the document
+        """
+        chunks = [document[i:i + self.chunk_size] for i in range(0, len(document), self.chunk_size)]
+        hashes = ChunkStore.leaf_hashes(chunks)
+        root = ChunkStore.merkle_root(hashes, len(document))
+
+        if self.manifest(root) == {'size': len(document), 'chunks': hashes}:
+            return root
+
+        for chunk, hash in zip(chunks, hashes):
+            path = self.chunk_path(hash)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ChunkStore.write(path, chunk)
+
+        ChunkStore.write(self.manifest_path(root), json.dumps({'size': len(document), 'chunks': hashes}).encode())
+        return root
+
+    def get(self, root):
+        """
+        Gets a document, the chunks are checked against their hash
+        :param root: Merkle root of the document
+        :return: bytes
+        """
+        manifest = self.manifest(root)
+        if manifest is None:
+            raise ValueError("Unknown document")
+
+        if ChunkStore.merkle_root(manifest['chunks'], manifest['size']) != root:
+            raise ValueError("Corrupted document")
+
+        chunks = []
+        for hash in manifest['chunks']:
+            with open(self.chunk_path(hash), "rb") as f:
+                chunks.append(f.read())
+
+        document = b"".join(chunks)
+        if ChunkStore.leaf_hashes(chunks) != manifest['chunks'] or len(document) != manifest['size']:
+            raise ValueError("Corrupted document")
+        return document
+
+    def manifest(self, root):
+        """
+        Gets the manifest of a document
+        :param root: Merkle root of the document
+        :return: dict with the size and the leaf hashes, None if unknown
+        """
+        try:
+            with open(self.manifest_path(root), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __contains__(self, root):
+        return os.path.exists(self.manifest_path(root))
@@ -1,8 +1,18 @@
 import bitarray
 from tools.ModularMath import ModularMath
+from tools import ProcessPool
 import libnum
 import random
 import copy
+import functools
+import base64
+import os
+import concurrent.futures
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Cipher():
@@ -49,11 +59,55 @@ class SerpentCipher(SymmetricCipher):
     """
     Serpent Cipher class
     Using 256 bits key
+
+    Three engines are available:
+    - "bitarray": reference engine, the state is a 128 bits bitarray
+    - "int": the state is held as four 32 bits words with byte-wise S-box tables
+    - "numpy": same as "int" on many blocks at once, falls back to "int" without NumPy
+    All engines produce the same ciphertext.
+
+    With parallel=True, large inputs are sharded across a shared process pool.
     """
 
-    def __init__(self, key):
+    ENGINES = ("bitarray", "int", "numpy")
+
+    WORD_MASK = 0xFFFFFFFF
+
+    # Version tag of the ciphertext storage encoding
+    CIPHERTEXT_TAG = "serpent1"
+
+    # ECB: blocks encrypted independently, PKCS#7 padded
+    # CBC: blocks chained with the previous ciphertext block, PKCS#7 padded, random IV in front of the ciphertext
+    # CTR: keystream of the encrypted counter blocks, random IV in front of the ciphertext
+    MODES = ("ecb", "cbc", "ctr")
+
+    # Number of bytes read at once by the streaming API
+    STREAM_CHUNK_SIZE = 65536
+
+    # Number of blocks processed at once by the NumPy engine
+    NUMPY_BATCH_SIZE = 65536
+
+    # Size in bytes below which a parallel cipher stays in the calling process
+    PARALLEL_THRESHOLD = 262144
+
+    # Number of expanded keys kept by the process-wide key schedule cache
+    KEY_SCHEDULE_CACHE_SIZE = 1024
+
+    def __init__(self, key, engine="int", mode="ecb", parallel=False):
         super().__init__(key)
-        self.SBox = SerpentCipher.sBoxGen()
+        if engine not in SerpentCipher.ENGINES:
+            raise ValueError(f"Unknown Serpent engine: {engine}")
+        if mode not in SerpentCipher.MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        if engine == "numpy" and numpy is None:
+            engine = "int"
+        self.engine = engine
+        self.mode = mode
+        self.parallel = parallel
+        self.SBox = SerpentCipher.sharedSBox()
+        self.InverseSBox = SerpentCipher.sharedInverseSBox()
+        self.roundKeys = None
+        self.iterationKeys = None
 
     IPTable = [
         0, 32, 64, 96, 1, 33, 65, 97, 2, 34, 66, 98, 3, 35, 67, 99, 4, 36, 68, 100, 5, 37, 69, 101, 6, 38, 70, 102, 7, 39, 71, 103, 8, 40, 72, 104, 9, 41, 73, 105, 10, 42, 74, 106, 11, 43, 75, 107, 12, 44, 76, 108, 13, 45, 77, 109, 14, 46, 78, 110, 15, 47, 79, 111, 16, 48, 80, 112, 17, 49, 81, 113, 18, 50, 82, 114, 19, 51, 83, 115, 20, 52, 84, 116, 21, 53, 85, 117, 22, 54, 86, 118, 23, 55, 87, 119, 24, 56, 88, 120, 25, 57, 89, 121, 26, 58, 90, 122, 27, 59, 91, 123, 28, 60, 92, 124, 29, 61, 93, 125, 30, 62, 94, 126, 31, 63, 95, 127
@@ -109,61 +163,639 @@ class SerpentCipher(SymmetricCipher):
         """
         Serpent encryption
         :param plaintext: plaintext
-        :return ciphertext: str
+        :return ciphertext: str, see encodeCiphertext()
         """
+        return SerpentCipher.encodeCiphertext(self.encrypt_bytes(plaintext.encode("utf-8")), self.mode)
 
-        # Split the plaintext into 128 bits blocks
-        blocks = self.splitPlainTextToBlocks(plaintext)
 
-        # Initial permutation
-        ciphertext = bitarray.bitarray()
-        for block in blocks:
-            ciphertext.extend(self.blockInitialPermutation(block))
+    def decrypt(self, ciphertext):
+        """
+        Serpent decryption, in the mode written in the ciphertext
+        Ciphertexts made of "0" and "1" written by older versions are still read
+        :param ciphertext: ciphertext
+        :return plaintext: str
+        """
+        if not SerpentCipher.isEncodedCiphertext(ciphertext):
+            return self.decryptLegacy(ciphertext)
+
+        mode, data = SerpentCipher.decodeCiphertext(ciphertext)
+        return self.decrypt_bytes(data, mode).decode("utf-8")
+
+
+    def decryptLegacy(self, ciphertext):
+        """
+        Serpent decryption of a "0" and "1" ciphertext, zero padded
+        :param ciphertext: ciphertext
+        :return plaintext: str
+        """
+        data = bitarray.bitarray(ciphertext).tobytes()
+
+        # bytes to str
+        plaintext = self.decryptBlocks(data).decode("utf-8").replace("\x00", "")
+
+        return plaintext
+
+
+    def encrypt_bytes(self, data):
+        """
+        Serpent encryption of bytes
+        ECB and CBC are PKCS#7 padded, CTR is not padded.
+        CBC and CTR ciphertexts start with their random 16 bytes IV.
+        :param data: plaintext bytes
+        :return: ciphertext bytes
+        """
+        if self.mode == "ctr":
+            iv = os.urandom(16)
+            return iv + self.ctrXor(data, iv)
+
+        if self.mode == "cbc":
+            iv = os.urandom(16)
+            return iv + self.cbcEncrypt(SerpentCipher.pad(data), iv)
+
+        return self.encryptBlocks(SerpentCipher.pad(data))
+
+
+    def decrypt_bytes(self, data, mode=None):
+        """
+        Serpent decryption of bytes
+        :param data: ciphertext bytes
+        :param mode: mode of operation, the mode of the cipher by default
+        :return: plaintext bytes
+        """
+        mode = mode or self.mode
+
+        if mode == "ctr":
+            if len(data) < 16:
+                raise ValueError("Invalid ciphertext length")
+            return self.ctrXor(data[16:], data[:16])
+
+        if mode == "cbc":
+            if len(data) < 32 or len(data) % 16 != 0:
+                raise ValueError("Invalid ciphertext length")
+            return SerpentCipher.unpad(self.cbcDecrypt(data[16:], data[:16]))
+
+        if len(data) == 0 or len(data) % 16 != 0:
+            raise ValueError("Invalid ciphertext length")
+        return SerpentCipher.unpad(self.decryptBlocks(data))
+
+
+    def decrypt_range(self, ciphertext, offset, length):
+        """
+        CTR decryption of a range of the plaintext only
+        Only the blocks covering the range are decrypted, a file is only read on those blocks.
+        :param ciphertext: str as returned by encrypt(), bytes as returned by encrypt_bytes()
+        or seekable binary file written by encrypt_stream()
+        :param offset: offset of the range in the plaintext
+        :param length: length of the range
+        :return: plaintext bytes, shorter than length at the end of the plaintext
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("Invalid range")
+
+        if isinstance(ciphertext, str):
+            mode, ciphertext = SerpentCipher.decodeCiphertext(ciphertext)
+        else:
+            mode = self.mode
+        if mode != "ctr":
+            raise ValueError("Range decryption needs the CTR mode")
+
+        first_block = offset // 16
+        start = first_block * 16
+        end = offset + length
+
+        if hasattr(ciphertext, "read"):
+            ciphertext.seek(0)
+            iv = ciphertext.read(16)
+            ciphertext.seek(16 + start)
+            data = ciphertext.read(end - start)
+        else:
+            iv = ciphertext[:16]
+            data = ciphertext[16 + start:16 + end]
+
+        if len(iv) != 16:
+            raise ValueError("Invalid ciphertext length")
+
+        return self.ctrXor(data, iv, first_block)[offset - start:]
+
+
+    def ctrXor(self, data, iv, first_block=0):
+        """
+        XOR data with the CTR keystream
+        Counter block i is (iv + i) mod 2^128, the keystream is its encryption.
+        :param data: bytes
+        :param iv: 16 bytes IV
+        :param first_block: index of the counter block of the first byte of data
+        :return: bytes
+        """
+        count = (len(data) + 15) // 16
+        start = int.from_bytes(iv, "big") + first_block
+        mask = (1 << 128) - 1
+        counters = b"".join(((start + i) & mask).to_bytes(16, "big") for i in range(count))
+        keystream = self.encryptBlocks(counters)[:len(data)]
+        return (int.from_bytes(data, "big") ^ int.from_bytes(keystream, "big")).to_bytes(len(data), "big")
+
+
+    def cbcEncrypt(self, data, iv):
+        """
+        CBC encryption of whole blocks, each block is XOR-ed with the previous ciphertext block
+        :param data: bytes, length multiple of 16
+        :param iv: 16 bytes IV, or last ciphertext block when chaining calls
+        :return: bytes
+        """
+        ciphertext = bytearray()
+        previous = int.from_bytes(iv, "big")
+        for i in range(0, len(data), 16):
+            block = (int.from_bytes(data[i:i+16], "big") ^ previous).to_bytes(16, "big")
+            block = self.encryptBlocks(block)
+            ciphertext += block
+            previous = int.from_bytes(block, "big")
+        return bytes(ciphertext)
+
+
+    def cbcDecrypt(self, data, iv):
+        """
+        CBC decryption of whole blocks
+        Unlike encryption, all blocks are decrypted at once.
+        :param data: bytes, length multiple of 16
+        :param iv: 16 bytes IV, or last ciphertext block when chaining calls
+        :return: bytes
+        """
+        decrypted = self.decryptBlocks(data)
+        previous = iv + data[:-16]
+        return (int.from_bytes(decrypted, "big") ^ int.from_bytes(previous, "big")).to_bytes(len(data), "big")
+
+
+    def encrypt_stream(self, source, sink, chunk_size=None):
+        """
+        Serpent encryption from a binary file to a binary file
+        Only one chunk is held in memory at a time, the output has the same format as encrypt_bytes().
+        :param source: binary file-like object or iterable of bytes
+        :param sink: binary file-like object
+        :param chunk_size: number of bytes read at once
+        :return: number of bytes written
+        """
+        written = 0
+        iv = None
+        block = 0
+        if self.mode != "ecb":
+            iv = os.urandom(16)
+            sink.write(iv)
+            written += 16
+
+        pending = b""
+        for chunk in SerpentCipher.readChunks(source, chunk_size):
+            pending += chunk
+            length = len(pending) - len(pending) % 16
+            if length:
+                if self.mode == "ctr":
+                    sink.write(self.ctrXor(pending[:length], iv, block))
+                elif self.mode == "cbc":
+                    encrypted = self.cbcEncrypt(pending[:length], iv)
+                    iv = encrypted[-16:]
+                    sink.write(encrypted)
+                else:
+                    sink.write(self.encryptBlocks(pending[:length]))
+                written += length
+                block += length // 16
+                pending = pending[length:]
+
+        # Last block, padded in ECB and CBC
+        if self.mode == "ctr":
+            last = self.ctrXor(pending, iv, block)
+        elif self.mode == "cbc":
+            last = self.cbcEncrypt(SerpentCipher.pad(pending), iv)
+        else:
+            last = self.encryptBlocks(SerpentCipher.pad(pending))
+        sink.write(last)
+
+        return written + len(last)
+
+
+    def decrypt_stream(self, source, sink, chunk_size=None):
+        """
+        Serpent decryption from a binary file to a binary file
+        :param source: binary file-like object or iterable of bytes
+        :param sink: binary file-like object
+        :param chunk_size: number of bytes read at once
+        :return: number of bytes written
+        """
+        written = 0
+        iv = None
+        block = 0
+
+        pending = b""
+        for chunk in SerpentCipher.readChunks(source, chunk_size):
+            pending += chunk
+            if self.mode != "ecb" and iv is None:
+                if len(pending) < 16:
+                    continue
+                iv, pending = pending[:16], pending[16:]
+
+            length = len(pending) - len(pending) % 16
+            # Keep the last block back, in ECB and CBC it holds the padding
+            if self.mode != "ctr" and length == len(pending):
+                length -= 16
+            if length > 0:
+                if self.mode == "ctr":
+                    sink.write(self.ctrXor(pending[:length], iv, block))
+                elif self.mode == "cbc":
+                    sink.write(self.cbcDecrypt(pending[:length], iv))
+                    iv = pending[length-16:length]
+                else:
+                    sink.write(self.decryptBlocks(pending[:length]))
+                written += length
+                block += length // 16
+                pending = pending[length:]
+
+        if self.mode != "ecb" and iv is None:
+            raise ValueError("Invalid ciphertext length")
+        if self.mode == "ctr":
+            last = self.ctrXor(pending, iv, block)
+        else:
+            if len(pending) != 16:
+                raise ValueError("Invalid ciphertext length")
+            if self.mode == "cbc":
+                last = SerpentCipher.unpad(self.cbcDecrypt(pending, iv))
+            else:
+                last = SerpentCipher.unpad(self.decryptBlocks(pending))
+        sink.write(last)
+
+        return written + len(last)
+
+
+    @staticmethod
+    def readChunks(source, chunk_size=None):
+        """
+        Read a binary file or an iterable of bytes chunk by chunk
+        :param source: binary file-like object or iterable of bytes
+        :param chunk_size: number of bytes read at once from a file
+        :return: generator of bytes
+        """
+        if not hasattr(source, "read"):
+            yield from source
+            return
+
+        chunk_size = chunk_size or SerpentCipher.STREAM_CHUNK_SIZE
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
 
-    
-        # Block encryption
-        for i in range(0, len(ciphertext), 128):
-            block = ciphertext[i:i+128]
-            ciphertext[i:i+128] = self.blockEncryption(block)
 
+    def encryptBlocks(self, data):
+        """
+        Serpent encryption of whole 128 bits blocks
+        :param data: bytes, length multiple of 16
+        :return: bytes
+        """
+        if self.parallel and ProcessPool.WORKERS > 1 and len(data) >= SerpentCipher.PARALLEL_THRESHOLD:
+            return self.parallelBlocks(data, decrypt=False)
+
+        if self.engine == "numpy":
+            return self.encryptBlocksNumpy(data)
+
+        if self.engine == "int":
+            ciphertext = bytearray()
+            for i in range(0, len(data), 16):
+                state = self.encryptBlockInt(int.from_bytes(data[i:i+16], "big"))
+                ciphertext += state.to_bytes(16, "big")
+            return bytes(ciphertext)
+
+        ciphertext = bitarray.bitarray()
+        ciphertext.frombytes(data)
 
-        # Final permutation
         for i in range(0, len(ciphertext), 128):
             block = ciphertext[i:i+128]
+            # Initial permutation
+            block = self.blockInitialPermutation(block)
+            # Block encryption
+            block = self.blockEncryption(block)
+            # Final permutation
             ciphertext[i:i+128] = self.blockFinalPermutation(block)
 
-        return ciphertext.to01()
+        return ciphertext.tobytes()
 
 
-    def decrypt(self, ciphertext):
+    def decryptBlocks(self, data):
         """
-        Serpent decryption
-        :param ciphertext: ciphertext
-        :return plaintext: str
+        Serpent decryption of whole 128 bits blocks
+        :param data: bytes, length multiple of 16
+        :return: bytes
         """
+        if self.parallel and ProcessPool.WORKERS > 1 and len(data) >= SerpentCipher.PARALLEL_THRESHOLD:
+            return self.parallelBlocks(data, decrypt=True)
 
-        blocks = self.splitCipherTextToBlocks(ciphertext)
-        plaintext = bitarray.bitarray()
+        if self.engine == "numpy":
+            return self.decryptBlocksNumpy(data)
 
-        # Reverse Final permutation
-        for block in blocks:
-            plaintext.extend(self.blockInitialPermutation(block))
+        if self.engine == "int":
+            plaintext = bytearray()
+            for i in range(0, len(data), 16):
+                state = self.decryptBlockInt(int.from_bytes(data[i:i+16], "big"))
+                plaintext += state.to_bytes(16, "big")
+            return bytes(plaintext)
+
+        plaintext = bitarray.bitarray()
+        plaintext.frombytes(data)
 
-        # Block decryption
-        for i in range(0, len(plaintext), 128):
-            block = plaintext[i:i+128]
-            plaintext[i:i+128] = self.blockDecryption(block)
-        
-        # Reverse Initial permutation
         for i in range(0, len(plaintext), 128):
             block = plaintext[i:i+128]
+            # Reverse Final permutation
+            block = self.blockInitialPermutation(block)
+            # Block decryption
+            block = self.blockDecryption(block)
+            # Reverse Initial permutation
             plaintext[i:i+128] = self.blockFinalPermutation(block)
 
-        # bitarray to str
-        plaintext = plaintext.tobytes().decode("utf-8").replace("\x00", "")
+        return plaintext.tobytes()
 
-        return plaintext
-        
+
+    def parallelBlocks(self, data, decrypt=False):
+        """
+        Serpent encryption or decryption of whole blocks, sharded across the process pool
+        Blocks are independent in ECB and for the CTR keystream, so shards can run in any order.
+        :param data: bytes, length multiple of 16
+        :param decrypt: decryption instead of encryption
+        :return: bytes
+        """
+        return b"".join(ProcessPool.map_shards(SerpentCipher.blocksWorker, data, self.key, self.engine, decrypt, align=16))
+
+
+    @staticmethod
+    def blocksWorker(data, key, engine, decrypt):
+        """
+        Process pool task of parallelBlocks()
+        :param data: bytes, length multiple of 16
+        :param key: 256 bits key
+        :param engine: engine used by the worker
+        :param decrypt: decryption instead of encryption
+        :return: bytes
+        """
+        cipher = SerpentCipher(key, engine=engine)
+        if decrypt:
+            return cipher.decryptBlocks(data)
+        return cipher.encryptBlocks(data)
+
+
+    @staticmethod
+    def configurePool(workers=None, threshold=None):
+        """
+        Configure the process pool shared by the parallel ciphers, see tools.ProcessPool
+        The current pool is shut down, a new one is started on next use.
+        :param workers: number of worker processes, number of cores by default
+        :param threshold: size in bytes below which the blocks stay in the calling process
+        """
+        ProcessPool.configure_pool(workers)
+        if threshold is not None:
+            SerpentCipher.PARALLEL_THRESHOLD = threshold
+
+    @staticmethod
+    def getPool():
+        """
+        Process pool shared by the parallel ciphers, started on first use
+        :return: ProcessPoolExecutor
+        """
+        return ProcessPool.get_pool()
+
+    @staticmethod
+    def shutdownPool():
+        """
+        Shut down the process pool shared by the parallel ciphers
+        """
+        ProcessPool.shutdown_pool()
+
+
+    def encryptBlockList(self, blocks):
+        """
+        Serpent encryption of a list of blocks in one pass
+        :param blocks: list of 128 bits bitarray, as returned by splitPlainTextToBlocks()
+        :return: list of 128 bits bitarray
+        """
+        return SerpentCipher.bytesToBlockList(self.encryptBlocks(b"".join(block.tobytes() for block in blocks)))
+
+
+    def decryptBlockList(self, blocks):
+        """
+        Serpent decryption of a list of blocks in one pass
+        :param blocks: list of 128 bits bitarray, as returned by splitCipherTextToBlocks()
+        :return: list of 128 bits bitarray
+        """
+        return SerpentCipher.bytesToBlockList(self.decryptBlocks(b"".join(block.tobytes() for block in blocks)))
+
+
+    def encryptBlocksNumpy(self, data):
+        """
+        Serpent encryption of whole 128 bits blocks, all blocks of a batch at once
+        Each word of the state is a NumPy uint32 array holding that word for every block.
+        :param data: bytes, length multiple of 16
+        :return: bytes
+        """
+        keys = self.getRoundKeys()
+        tables = SerpentCipher.sharedNumpyTables()
+        ciphertext = []
+
+        step = SerpentCipher.NUMPY_BATCH_SIZE * 16
+        for offset in range(0, len(data), step):
+            x0, x1, x2, x3 = SerpentCipher.bytesToNumpyWords(data[offset:offset+step], SerpentCipher.IPTable)
+
+            # 32 rounds
+            for i in range(32):
+                key = keys[i]
+                table = tables[i][0]
+
+                # XOR with the key
+                x0 = x0 ^ numpy.uint32(key[0])
+                x1 = x1 ^ numpy.uint32(key[1])
+                x2 = x2 ^ numpy.uint32(key[2])
+                x3 = x3 ^ numpy.uint32(key[3])
+
+                # Sbox
+                x0 = table[0][x0 >> 24] | table[1][(x0 >> 16) & 0xFF] | table[2][(x0 >> 8) & 0xFF] | table[3][x0 & 0xFF]
+                x1 = table[4][x1 >> 24] | table[5][(x1 >> 16) & 0xFF] | table[6][(x1 >> 8) & 0xFF] | table[7][x1 & 0xFF]
+                x2 = table[8][x2 >> 24] | table[9][(x2 >> 16) & 0xFF] | table[10][(x2 >> 8) & 0xFF] | table[11][x2 & 0xFF]
+                x3 = table[12][x3 >> 24] | table[13][(x3 >> 16) & 0xFF] | table[14][(x3 >> 8) & 0xFF] | table[15][x3 & 0xFF]
+
+                # Linear transformation, uint32 shifts drop the overflowing bits
+                x0 = (x0 << 13) | (x0 >> 19)
+                x2 = (x2 << 3) | (x2 >> 29)
+                x1 = x1 ^ x0 ^ x2
+                x3 = x3 ^ x2 ^ (x0 << 3)
+                x1 = (x1 << 1) | (x1 >> 31)
+                x3 = (x3 << 7) | (x3 >> 25)
+                x0 = x0 ^ x1 ^ x3
+                x2 = x2 ^ x3 ^ (x1 << 7)
+                x0 = (x0 << 5) | (x0 >> 27)
+                x2 = (x2 << 22) | (x2 >> 10)
+
+            ciphertext.append(SerpentCipher.numpyWordsToBytes((x0, x1, x2, x3), SerpentCipher.FPTable))
+
+        return b"".join(ciphertext)
+
+
+    def decryptBlocksNumpy(self, data):
+        """
+        Serpent decryption of whole 128 bits blocks, all blocks of a batch at once
+        :param data: bytes, length multiple of 16
+        :return: bytes
+        """
+        keys = self.getRoundKeys()
+        tables = SerpentCipher.sharedNumpyTables()
+        plaintext = []
+
+        step = SerpentCipher.NUMPY_BATCH_SIZE * 16
+        for offset in range(0, len(data), step):
+            x0, x1, x2, x3 = SerpentCipher.bytesToNumpyWords(data[offset:offset+step], SerpentCipher.IPTable)
+
+            # 32 rounds
+            for i in range(31, -1, -1):
+                key = keys[i]
+                table = tables[i][1]
+
+                # Linear transformation
+                x2 = (x2 >> 22) | (x2 << 10)
+                x0 = (x0 >> 5) | (x0 << 27)
+                x2 = x2 ^ x3 ^ (x1 << 7)
+                x0 = x0 ^ x1 ^ x3
+                x3 = (x3 >> 7) | (x3 << 25)
+                x1 = (x1 >> 1) | (x1 << 31)
+                x3 = x3 ^ x2 ^ (x0 << 3)
+                x1 = x1 ^ x0 ^ x2
+                x2 = (x2 >> 3) | (x2 << 29)
+                x0 = (x0 >> 13) | (x0 << 19)
+
+                # Sbox
+                x0 = table[0][x0 >> 24] | table[1][(x0 >> 16) & 0xFF] | table[2][(x0 >> 8) & 0xFF] | table[3][x0 & 0xFF]
+                x1 = table[4][x1 >> 24] | table[5][(x1 >> 16) & 0xFF] | table[6][(x1 >> 8) & 0xFF] | table[7][x1 & 0xFF]
+                x2 = table[8][x2 >> 24] | table[9][(x2 >> 16) & 0xFF] | table[10][(x2 >> 8) & 0xFF] | table[11][x2 & 0xFF]
+                x3 = table[12][x3 >> 24] | table[13][(x3 >> 16) & 0xFF] | table[14][(x3 >> 8) & 0xFF] | table[15][x3 & 0xFF]
+
+                # XOR with the key
+                x0 = x0 ^ numpy.uint32(key[0])
+                x1 = x1 ^ numpy.uint32(key[1])
+                x2 = x2 ^ numpy.uint32(key[2])
+                x3 = x3 ^ numpy.uint32(key[3])
+
+            plaintext.append(SerpentCipher.numpyWordsToBytes((x0, x1, x2, x3), SerpentCipher.FPTable))
+
+        return b"".join(plaintext)
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sharedNumpyTables():
+        """
+        Byte-wise S-box tables as NumPy arrays, generated once per process
+        :return: list of (encryption table, decryption table) for each round
+        """
+        tables = []
+        # Rounds sharing the same S-boxes share the same arrays
+        cache = {}
+        for encryption, decryption in SerpentCipher.sharedSBoxTables():
+            if id(encryption) not in cache:
+                cache[id(encryption)] = (
+                    numpy.array(encryption, dtype=numpy.uint32),
+                    numpy.array(decryption, dtype=numpy.uint32),
+                )
+            tables.append(cache[id(encryption)])
+        return tables
+
+    @staticmethod
+    def bytesToNumpyWords(data, table):
+        """
+        Permute every block of data and split it into 4 words of 32 bits
+        :param data: bytes, length multiple of 16
+        :param table: permutation table
+        :return: 4 uint32 arrays, one value per block
+        """
+        bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 16), axis=1)
+        blocks = numpy.ascontiguousarray(numpy.packbits(bits[:, table], axis=1))
+        words = blocks.view(">u4").astype(numpy.uint32)
+        return [numpy.ascontiguousarray(words[:, i]) for i in range(4)]
+
+    @staticmethod
+    def numpyWordsToBytes(words, table):
+        """
+        Join 4 words of 32 bits into blocks and permute every block
+        :param words: 4 uint32 arrays, one value per block
+        :param table: permutation table
+        :return: bytes
+        """
+        blocks = numpy.stack(words, axis=1).astype(">u4").view(numpy.uint8)
+        bits = numpy.unpackbits(blocks, axis=1)
+        return numpy.packbits(bits[:, table], axis=1).tobytes()
+
+    @staticmethod
+    def bytesToBlockList(data):
+        """
+        Split bytes into 128 bits blocks
+        :param data: bytes, length multiple of 16
+        :return: list of 128 bits bitarray
+        """
+        blocks = []
+        for i in range(0, len(data), 16):
+            block = bitarray.bitarray()
+            block.frombytes(data[i:i+16])
+            blocks.append(block)
+        return blocks
+
+    @staticmethod
+    def pad(data):
+        """
+        PKCS#7 padding to a multiple of 16 bytes
+        :param data: bytes
+        :return: padded bytes
+        """
+        length = 16 - len(data) % 16
+        return data + bytes([length]) * length
+
+    @staticmethod
+    def unpad(data):
+        """
+        Remove PKCS#7 padding
+        :param data: padded bytes
+        :return: bytes
+        """
+        length = data[-1] if data else 0
+        if length < 1 or length > 16 or data[-length:] != bytes([length]) * length:
+            raise ValueError("Invalid padding")
+        return data[:-length]
+
+    @staticmethod
+    def encodeCiphertext(data, mode="ecb"):
+        """
+        Storage encoding of a ciphertext: "serpent1:<mode>:<base64>"
+        :param data: ciphertext bytes
+        :param mode: mode of operation
+        :return: str
+        """
+        return f"{SerpentCipher.CIPHERTEXT_TAG}:{mode}:{base64.b64encode(data).decode('ascii')}"
+
+    @staticmethod
+    def decodeCiphertext(ciphertext):
+        """
+        Parse a ciphertext written by encodeCiphertext()
+        :param ciphertext: str
+        :return: (mode, ciphertext bytes)
+        """
+        try:
+            tag, mode, data = ciphertext.split(":")
+        except ValueError:
+            raise ValueError("Invalid ciphertext")
+        if tag != SerpentCipher.CIPHERTEXT_TAG:
+            raise ValueError(f"Unsupported ciphertext version: {tag}")
+        if mode not in SerpentCipher.MODES:
+            raise ValueError(f"Unsupported mode: {mode}")
+        return mode, base64.b64decode(data)
+
+    @staticmethod
+    def isEncodedCiphertext(ciphertext):
+        """
+        Whether a ciphertext uses the storage encoding rather than "0" and "1"
+        :param ciphertext: str
+        :return: bool
+        """
+        return ":" in ciphertext
 
     
 
@@ -173,7 +805,7 @@ class SerpentCipher(SymmetricCipher):
         :param block: 128 bits block
         :return: 128 bits block
         """
-        keys = self.iterationKeysGen()
+        keys = self.getIterationKeys()
 
         # 32 rounds
         for i in range(32):
@@ -188,11 +820,11 @@ class SerpentCipher(SymmetricCipher):
         :return: 128 bits block
         """
 
-        keys = self.iterationKeysGen()
+        keys = self.getIterationKeys()
 
         # 32 rounds
         for i in range(31,-1,-1):
-            block = self.decryptRound(block, keys[i], self.SBox[i])
+            block = self.decryptRound(block, keys[i], self.InverseSBox[i])
     
 
         return block
@@ -223,11 +855,12 @@ class SerpentCipher(SymmetricCipher):
 
         return block
     
-    def decryptRound(self, block, key, _SBox):
+    def decryptRound(self, block, key, _InverseSBox):
         """
         Serpent round
         :param block: 128 bits block
         :param key: 32 bits key
+        :param _InverseSBox: inverse S-boxes of the round
         :return: 128 bits block
         """
         
@@ -239,7 +872,7 @@ class SerpentCipher(SymmetricCipher):
         for i in range(0, len(block), 4):
             index = i // 4
             current = block[i:i+4]
-            result = bin(_SBox[index].index(int(current.to01(), 2)))
+            result = bin(_InverseSBox[index][int(current.to01(), 2)])
             result = result[2:].zfill(4)
             block[i:i+4] = bitarray.bitarray(result)
 
@@ -324,6 +957,361 @@ class SerpentCipher(SymmetricCipher):
         return result
     
 
+    def encryptBlockInt(self, state):
+        """
+        Serpent encryption of one block on the integer engine, permutations included
+        :param state: 128 bits block as an int
+        :return: 128 bits block as an int
+        """
+        state = SerpentCipher.initialPermutationInt(state)
+        state = self.blockEncryptionInt(state)
+        return SerpentCipher.finalPermutationInt(state)
+
+    def decryptBlockInt(self, state):
+        """
+        Serpent decryption of one block on the integer engine, permutations included
+        :param state: 128 bits block as an int
+        :return: 128 bits block as an int
+        """
+        state = SerpentCipher.initialPermutationInt(state)
+        state = self.blockDecryptionInt(state)
+        return SerpentCipher.finalPermutationInt(state)
+
+    def blockEncryptionInt(self, state):
+        """
+        Serpent block encryption on the integer engine
+        :param state: 128 bits block as an int
+        :return: 128 bits block as an int
+        """
+        keys = self.getRoundKeys()
+        tables = SerpentCipher.sharedSBoxTables()
+
+        words = SerpentCipher.splitWords(state)
+
+        # 32 rounds
+        for i in range(32):
+            words = self.encryptRoundInt(words, keys[i], tables[i][0])
+
+        return SerpentCipher.joinWords(words)
+
+    def blockDecryptionInt(self, state):
+        """
+        Serpent block decryption on the integer engine
+        :param state: 128 bits block as an int
+        :return: 128 bits block as an int
+        """
+        keys = self.getRoundKeys()
+        tables = SerpentCipher.sharedSBoxTables()
+
+        words = SerpentCipher.splitWords(state)
+
+        # 32 rounds
+        for i in range(31, -1, -1):
+            words = self.decryptRoundInt(words, keys[i], tables[i][1])
+
+        return SerpentCipher.joinWords(words)
+
+    @staticmethod
+    def encryptRoundInt(words, key, table):
+        """
+        Serpent round on the integer engine
+        :param words: 4 words of 32 bits
+        :param key: 4 words of 32 bits
+        :param table: byte-wise S-box table of the round
+        :return: 4 words of 32 bits
+        """
+        M = SerpentCipher.WORD_MASK
+
+        # XOR with the key
+        x0 = words[0] ^ key[0]
+        x1 = words[1] ^ key[1]
+        x2 = words[2] ^ key[2]
+        x3 = words[3] ^ key[3]
+
+        # Sbox
+        x0 = table[0][x0 >> 24] | table[1][(x0 >> 16) & 0xFF] | table[2][(x0 >> 8) & 0xFF] | table[3][x0 & 0xFF]
+        x1 = table[4][x1 >> 24] | table[5][(x1 >> 16) & 0xFF] | table[6][(x1 >> 8) & 0xFF] | table[7][x1 & 0xFF]
+        x2 = table[8][x2 >> 24] | table[9][(x2 >> 16) & 0xFF] | table[10][(x2 >> 8) & 0xFF] | table[11][x2 & 0xFF]
+        x3 = table[12][x3 >> 24] | table[13][(x3 >> 16) & 0xFF] | table[14][(x3 >> 8) & 0xFF] | table[15][x3 & 0xFF]
+
+        # Linear transformation
+        x0 = ((x0 << 13) | (x0 >> 19)) & M
+        x2 = ((x2 << 3) | (x2 >> 29)) & M
+        x1 = x1 ^ x0 ^ x2
+        x3 = x3 ^ x2 ^ ((x0 << 3) & M)
+        x1 = ((x1 << 1) | (x1 >> 31)) & M
+        x3 = ((x3 << 7) | (x3 >> 25)) & M
+        x0 = x0 ^ x1 ^ x3
+        x2 = x2 ^ x3 ^ ((x1 << 7) & M)
+        x0 = ((x0 << 5) | (x0 >> 27)) & M
+        x2 = ((x2 << 22) | (x2 >> 10)) & M
+
+        return (x0, x1, x2, x3)
+
+    @staticmethod
+    def decryptRoundInt(words, key, table):
+        """
+        Serpent inverse round on the integer engine
+        :param words: 4 words of 32 bits
+        :param key: 4 words of 32 bits
+        :param table: byte-wise inverse S-box table of the round
+        :return: 4 words of 32 bits
+        """
+        M = SerpentCipher.WORD_MASK
+        x0, x1, x2, x3 = words
+
+        # Linear transformation
+        x2 = ((x2 >> 22) | (x2 << 10)) & M
+        x0 = ((x0 >> 5) | (x0 << 27)) & M
+        x2 = x2 ^ x3 ^ ((x1 << 7) & M)
+        x0 = x0 ^ x1 ^ x3
+        x3 = ((x3 >> 7) | (x3 << 25)) & M
+        x1 = ((x1 >> 1) | (x1 << 31)) & M
+        x3 = x3 ^ x2 ^ ((x0 << 3) & M)
+        x1 = x1 ^ x0 ^ x2
+        x2 = ((x2 >> 3) | (x2 << 29)) & M
+        x0 = ((x0 >> 13) | (x0 << 19)) & M
+
+        # Sbox
+        x0 = table[0][x0 >> 24] | table[1][(x0 >> 16) & 0xFF] | table[2][(x0 >> 8) & 0xFF] | table[3][x0 & 0xFF]
+        x1 = table[4][x1 >> 24] | table[5][(x1 >> 16) & 0xFF] | table[6][(x1 >> 8) & 0xFF] | table[7][x1 & 0xFF]
+        x2 = table[8][x2 >> 24] | table[9][(x2 >> 16) & 0xFF] | table[10][(x2 >> 8) & 0xFF] | table[11][x2 & 0xFF]
+        x3 = table[12][x3 >> 24] | table[13][(x3 >> 16) & 0xFF] | table[14][(x3 >> 8) & 0xFF] | table[15][x3 & 0xFF]
+
+        # XOR with the key
+        return (x0 ^ key[0], x1 ^ key[1], x2 ^ key[2], x3 ^ key[3])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sharedSBox():
+        """
+        S-boxes of the 32 rounds, generated once per process
+        Shared by every cipher, must not be modified
+        :return: S-boxes of the 32 rounds
+        """
+        return SerpentCipher.sBoxGen()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sharedInverseSBox():
+        """
+        Inverse S-boxes of the 32 rounds, generated once per process
+        Shared by every cipher, must not be modified
+        :return: inverse S-boxes of the 32 rounds
+        """
+        return SerpentCipher.inverseSBoxGen(SerpentCipher.sharedSBox())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sharedSBoxTables():
+        """
+        Byte-wise S-box tables of the integer engine, generated once per process
+        :return: list of (encryption table, decryption table) for each round
+        """
+        return SerpentCipher.sBoxTablesGen(SerpentCipher.sharedSBox(), SerpentCipher.sharedInverseSBox())
+
+    @staticmethod
+    def inverseSBoxGen(SBox):
+        """
+        Inverse SBox generation
+        :param SBox: S-boxes of the 32 rounds
+        :return: inverse S-boxes of the 32 rounds
+        """
+        InverseSBox = []
+        # Rounds sharing the same S-boxes share the same inverse S-boxes
+        cache = {}
+        for round_sbox in SBox:
+            if id(round_sbox) not in cache:
+                inverse = []
+                for sbox in round_sbox:
+                    inverse_sbox = [0] * 16
+                    # Reversed so that the first match wins, as with list.index()
+                    for value in range(15, -1, -1):
+                        inverse_sbox[sbox[value]] = value
+                    inverse.append(inverse_sbox)
+                cache[id(round_sbox)] = inverse
+            InverseSBox.append(cache[id(round_sbox)])
+        return InverseSBox
+
+    @staticmethod
+    def sBoxTablesGen(SBox, InverseSBox):
+        """
+        Byte-wise S-box tables generation
+        Each of the 16 bytes of the state goes through two nibble S-boxes, the
+        tables map a byte value to its substituted value already shifted to its
+        place in the 32 bits word.
+        :param SBox: S-boxes of the 32 rounds
+        :param InverseSBox: inverse S-boxes of the 32 rounds
+        :return: list of (encryption table, decryption table) for each round
+        """
+        tables = []
+        # Rounds sharing the same S-boxes share the same tables
+        cache = {}
+        for round_sbox, round_inverse in zip(SBox, InverseSBox):
+            if id(round_sbox) not in cache:
+                cache[id(round_sbox)] = (
+                    SerpentCipher.byteTablesGen(round_sbox),
+                    SerpentCipher.byteTablesGen(round_inverse),
+                )
+            tables.append(cache[id(round_sbox)])
+        return tables
+
+    @staticmethod
+    def byteTablesGen(nibble_sboxes):
+        """
+        Merge 32 nibble S-boxes into 16 byte tables
+        :param nibble_sboxes: 32 S-boxes of 16 values
+        :return: 16 tables of 256 values
+        """
+        tables = []
+        for index in range(16):
+            high = nibble_sboxes[2 * index]
+            low = nibble_sboxes[2 * index + 1]
+            shift = 24 - 8 * (index % 4)
+            tables.append([((high[value >> 4] << 4) | low[value & 0xF]) << shift for value in range(256)])
+        return tables
+
+    @staticmethod
+    def initialPermutationInt(state):
+        """
+        Initial permutation of a 128 bits int, same as blockInitialPermutation()
+        :param state: 128 bits block as an int
+        :return: 128 bits block as an int
+        """
+        result = 0
+        for table, value in zip(SerpentCipher.sharedPermutationTables()[0], state.to_bytes(16, "big")):
+            result |= table[value]
+        return result
+
+    @staticmethod
+    def finalPermutationInt(state):
+        """
+        Final permutation of a 128 bits int, same as blockFinalPermutation()
+        :param state: 128 bits block as an int
+        :return: 128 bits block as an int
+        """
+        result = 0
+        for table, value in zip(SerpentCipher.sharedPermutationTables()[1], state.to_bytes(16, "big")):
+            result |= table[value]
+        return result
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sharedPermutationTables():
+        """
+        Byte-wise tables of the initial and final permutations, generated once per process
+        :return: (initial permutation tables, final permutation tables)
+        """
+        return (
+            SerpentCipher.permutationTablesGen(SerpentCipher.IPTable),
+            SerpentCipher.permutationTablesGen(SerpentCipher.FPTable),
+        )
+
+    @staticmethod
+    def permutationTablesGen(table):
+        """
+        Byte-wise permutation tables generation
+        For each of the 16 input bytes, the table maps the byte value to the
+        output bits it sets, so a permutation is 16 lookups OR-ed together.
+        :param table: permutation table, output bit i is input bit table[i]
+        :return: 16 tables of 256 values
+        """
+        # Output bits set by each input bit, bit 0 being the most significant one
+        masks = [0] * 128
+        for output_bit, input_bit in enumerate(table):
+            masks[input_bit] |= 1 << (127 - output_bit)
+
+        tables = []
+        for index in range(16):
+            byte_masks = masks[8 * index:8 * index + 8]
+            byte_table = []
+            for value in range(256):
+                result = 0
+                for bit in range(8):
+                    if (value >> (7 - bit)) & 1:
+                        result |= byte_masks[bit]
+                byte_table.append(result)
+            tables.append(byte_table)
+        return tables
+
+    @staticmethod
+    def bitsToInt(block):
+        """
+        bitarray to int, the first bit being the most significant one
+        :param block: bitarray
+        :return: int
+        """
+        return int(block.to01(), 2)
+
+    @staticmethod
+    def intToBits(state, bit_size=128):
+        """
+        int to bitarray, the first bit being the most significant one
+        :param state: int
+        :param bit_size: size of the bitarray
+        :return: bitarray
+        """
+        return bitarray.bitarray(format(state, f"0{bit_size}b"))
+
+    @staticmethod
+    def splitWords(state):
+        """
+        Split a 128 bits int into 4 words of 32 bits
+        :param state: 128 bits int
+        :return: tuple of 4 words
+        """
+        M = SerpentCipher.WORD_MASK
+        return ((state >> 96) & M, (state >> 64) & M, (state >> 32) & M, state & M)
+
+    @staticmethod
+    def joinWords(words):
+        """
+        Join 4 words of 32 bits into a 128 bits int
+        :param words: tuple of 4 words
+        :return: 128 bits int
+        """
+        return (words[0] << 96) | (words[1] << 64) | (words[2] << 32) | words[3]
+
+    def getRoundKeys(self):
+        """
+        Round keys of the integer engine, expanded on first use
+        :return: tuple of 32 round keys of 4 words of 32 bits
+        """
+        if self.roundKeys is None:
+            self.roundKeys = SerpentCipher.keySchedule(self.key)
+        return self.roundKeys
+
+    def getIterationKeys(self):
+        """
+        Round keys of the bitarray engine, expanded on first use
+        :return: list of 128 bits keys
+        """
+        if self.iterationKeys is None:
+            self.iterationKeys = [SerpentCipher.intToBits(SerpentCipher.joinWords(key)) for key in self.getRoundKeys()]
+        return self.iterationKeys
+
+    @staticmethod
+    @functools.lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+    def keySchedule(key):
+        """
+        Key schedule on 32 bits words, cached process-wide by key
+        Same round keys as iterationKeysGen()
+        :param key: 256 bits key
+        :return: tuple of 32 round keys of 4 words of 32 bits
+        """
+        M = SerpentCipher.WORD_MASK
+        omega = 0x9E3779B9
+
+        # w0 to w7
+        w = [int(key[i:i+32], 2) for i in range(0, len(key), 32)]
+
+        # w8 to w131
+        for i in range(8, 132):
+            x = w[i-8] ^ w[i-5] ^ w[i-3] ^ w[i-1] ^ omega ^ i
+            w.append(((x << 11) | (x >> 21)) & M)
+
+        return tuple(tuple(w[4*i:4*i+4]) for i in range(32))
+
     def iterationKeysGen(self):
         """
         Iteration keys generation
@@ -459,19 +1447,117 @@ class RSA(AsymmetricCipher):
     RSA Cipher class
     """
 
+    # Public exponent
+    E = 65537
+
     @staticmethod
-    def keyGen():
+    def keyGen(workers=None):
         """
         Key generation
         2048 digits numbers
+        The private key is (n, d, p, q, dP, dQ, qInv) for the Chinese Remainder Theorem
+        :param workers: number of searches run at once on the shared process pool (optional)
+        """
+        if workers and workers > 1:
+            p, q = RSA.parallelPrimes(1024, 2, workers)
+        else:
+            p = RSA.generatePrime(1024)
+            q = RSA.generatePrime(1024)
+        return RSA.keysFromPrimes(p, q)
+
+    @staticmethod
+    def generatePrime(bits, stop=None):
+        """
+        Prime for an RSA key
+        Primes p with E dividing p - 1 are skipped, d would not exist
+        :param bits: number of bits
+        :param stop: event ending the search when set (optional)
+        :return: prime number, None if stopped
+        """
+        while True:
+            prime = ModularMath.generate_prime_number(bits, stop=stop)
+            if prime is None or (prime - 1) % RSA.E != 0:
+                return prime
+
+    @staticmethod
+    def keyGenMany(count, workers=None):
+        """
+        Generates several key pairs, split in shards on the shared process pool
+        :param count: number of key pairs
+        :param workers: number of shards (optional)
+        :return: list of key pairs
+        """
+        if not workers or workers < 2 or count < 2:
+            return [RSA.keyGen() for _ in range(count)]
+        shards = ProcessPool.map_shards(RSA.keyGenWorker, range(count), count=workers)
+        return [keys for shard in shards for keys in shard]
+
+    @staticmethod
+    def keyGenWorker(shard):
+        return [RSA.keyGen() for _ in shard]
+
+    @staticmethod
+    def primeWorker(bits):
+        return RSA.generatePrime(bits, stop=ProcessPool.stop)
+
+    @staticmethod
+    def parallelPrimes(bits, count, workers):
+        """
+        Searches distinct primes on the shared process pool
+        Every search draws its own random candidates, all stop once count primes are found
+        :param bits: number of bits of the primes
+        :param count: number of primes
+        :param workers: number of searches run at once
+        :return: list of primes
+        """
+        primes = []
+        with ProcessPool.search() as stop:
+            pool = ProcessPool.get_pool()
+            futures = {pool.submit(RSA.primeWorker, bits) for _ in range(workers)}
+            while len(primes) < count:
+                done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    prime = future.result()
+                    if prime not in primes and len(primes) < count:
+                        primes.append(prime)
+                    # Keeps every process busy until enough primes are found
+                    if len(primes) < count:
+                        futures.add(pool.submit(RSA.primeWorker, bits))
+            stop.set()
+            concurrent.futures.wait(futures)
+        return primes
+
+    @staticmethod
+    def keysFromPrimes(p, q):
+        """
+        Key pair from two primes
+        :return: (n, e), (n, d, p, q, dP, dQ, qInv)
         """
-        p = ModularMath.generate_prime_number(1024)
-        q = ModularMath.generate_prime_number(1024)
         n = p * q
         phi = (p - 1) * (q - 1)
-        e = 65537
+        e = RSA.E
         d = ModularMath.mod_inverse(e, phi)
-        return (n, e), (n, d)
+        if d is None or p == q:
+            raise ValueError("No RSA key for these primes")
+        return (n, e), (n, d, p, q, d % (p - 1), d % (q - 1), ModularMath.mod_inverse(q, p))
+
+    @staticmethod
+    def privatePow(value, private_key):
+        """
+        Exponentiation with the private key
+        Uses the Chinese Remainder Theorem when the key has p and q, (n, d) keys are still supported
+        :param value: integer
+        :param private_key: (n, d) or (n, d, p, q, dP, dQ, qInv)
+        :return: value^d mod n
+        """
+        if len(private_key) < 7:
+            return pow(value, private_key[1], private_key[0])
+
+        _, _, p, q, dP, dQ, qInv = private_key[:7]
+        m1 = pow(value % p, dP, p)
+        m2 = pow(value % q, dQ, q)
+        h = (qInv * (m1 - m2)) % p
+        return m2 + h * q
 
     def encrypt(self, plaintext, key="Public"):
         """
@@ -481,7 +1567,7 @@ class RSA(AsymmetricCipher):
         if key == "Public":
             ciphertext = pow(plaintext, self.public_key[1], self.public_key[0])
         elif key == "Private":
-            ciphertext = pow(plaintext, self.private_key[1], self.private_key[0])
+            ciphertext = RSA.privatePow(plaintext, self.private_key)
         return ciphertext
 
     def decrypt(self, ciphertext, key="Private"):
@@ -490,7 +1576,7 @@ class RSA(AsymmetricCipher):
         """
         ciphertext = int(ciphertext)
         if key == "Private":
-            plaintext = pow(ciphertext, self.private_key[1], self.private_key[0])
+            plaintext = RSA.privatePow(ciphertext, self.private_key)
         elif key == "Public":
             plaintext = pow(ciphertext, self.public_key[1], self.public_key[0])
 
@@ -502,7 +1588,7 @@ class RSA(AsymmetricCipher):
         RSA signature
         """
         message = libnum.s2n(message)
-        signature = pow(message, self.private_key[1], self.private_key[0])
+        signature = RSA.privatePow(message, self.private_key)
         return signature
     
     def verify(self, message, signature):
@@ -1,4 +1,5 @@
 from tools.KDF import KDF
+from tools.KDF import KDFCheckpoints
 from tools.Cipher import RSA
 from tools.Cipher import SerpentCipher
 import json
@@ -27,14 +28,58 @@ class Conversation:
         except:
             raise Exception("No conversation with this user")
         
-        self.kfd = KDF(self.chain_key, self.salt, 256)
+        self.kfd = self.restore_kdf(conversations[self.other.username])
+        self.iterations = self.kfd.iteration
 
-        try:
-            self.iterations = len(conversations[self.other.username]['messages'])
-            for _ in range(self.iterations):
-                self.kfd.derive()
-        except:
-            self.iterations = 0
+
+    def restore_kdf(self, conversation):
+        """
+        Rebuilds the KDF positioned after the last message
+        :param conversation: The conversation record of src/tools/conversation/{me}.json
+        :return: The KDF
+        """
+        return self.kdf_at(conversation, len(conversation.get('messages', [])))
+
+
+    def kdf_at(self, conversation, iteration):
+        """
+        Rebuilds the KDF positioned at an iteration
+        Starts from the nearest saved state before it: the ratchet state, a checkpoint
+        or the first chain key
+        :param conversation: The conversation record of src/tools/conversation/{me}.json
+        :param iteration: The iteration, i.e. the index of the next message
+        :return: The KDF
+        """
+        kdf = KDF(self.chain_key, self.salt, 256)
+
+        start = KDFCheckpoints(conversation.get('checkpoints')).nearest(iteration)
+        ratchet = conversation.get('ratchet')
+        if ratchet and ratchet['iteration'] <= iteration and (start is None or ratchet['iteration'] > start[0]):
+            start = (ratchet['iteration'], ratchet['chain_key'])
+
+        if start is not None:
+            rsa = RSA(None, self.me.getPrivateKey())
+            kdf.seek(rsa.decrypt(start[1], key="Private"), start[0])
+
+        while kdf.iteration < iteration:
+            kdf.derive()
+
+        return kdf
+
+
+    @staticmethod
+    def ratchet_state(owner, kdf):
+        """
+        Ratchet state saved with the messages, the chain key is encrypted with the owner's public key
+        :param owner: The user owning the conversation file
+        :param kdf: The KDF positioned after the last message
+        :return: The ratchet state
+        """
+        rsa = RSA(owner.getPublicKey(), None)
+        return {
+            'chain_key': rsa.encrypt(kdf.chain_key, key="Public"),
+            'iteration': kdf.iteration
+        }
 
 
 
@@ -109,28 +154,42 @@ class Conversation:
         :param message: The message to send
         :return: None
         """
-        # Encrypt the message
-        self.kfd = KDF(self.chain_key, self.salt, 256)
+        # Messages may have been added since the KDF was restored
         nb_messages = Conversation.get_number_of_messages(self.me, self.other)
-        for _ in range(nb_messages):
-            self.kfd.derive()
+        if self.kfd.iteration != nb_messages:
+            with open(f"src/tools/conversations/{self.me.username}.json", "r") as f:
+                self.kfd = self.restore_kdf(json.load(f)[self.other.username])
+
+        # Save a checkpoint of the chain key every KDFCheckpoints.INTERVAL messages
+        if KDFCheckpoints().is_due(self.kfd.iteration):
+            for owner in (self.me, self.other):
+                rsa = RSA(owner.getPublicKey(), None)
+                checkpoint = (self.kfd.iteration, rsa.encrypt(self.kfd.chain_key, key="Public"))
+                Conversation.save_checkpoint_in_conversation(self.me, self.other, checkpoint, owner=owner)
+
+        # Encrypt the message
         secret_key = self.kfd.derive()
         cipher = SerpentCipher(secret_key)
         encrypted_message = cipher.encrypt(message)
+        self.iterations = self.kfd.iteration
         
 
         # Save the message in src/tools/conversation/{me}.json with the other messages
-        Conversation.save_message_in_conversation(self.me, self.other, encrypted_message, owner=self.me)
-        Conversation.save_message_in_conversation(self.me, self.other, encrypted_message, owner=self.other)
+        Conversation.save_message_in_conversation(self.me, self.other, encrypted_message, owner=self.me, ratchet=Conversation.ratchet_state(self.me, self.kfd))
+        Conversation.save_message_in_conversation(self.me, self.other, encrypted_message, owner=self.other, ratchet=Conversation.ratchet_state(self.other, self.kfd))
 
         return True
     
-    def get_messages(self):
+    def get_messages(self, start=0, end=None):
         """
         Gets the messages
+        Only the keys of the requested window are derived, from the nearest checkpoint
+        :param start: Index of the first message (optional)
+        :param end: Index after the last message (optional)
         :return: The messages
         """
         # Get the messages from src/tools/conversation/{me}.json
+        conversation = {}
         try:
             with open(f"src/tools/conversations/{self.me.username}.json", "r") as f:
                 conversations = json.load(f)
@@ -138,19 +197,22 @@ class Conversation:
                 if not self.other.username in conversations:
                     messages = []
                 else:
+                    conversation = conversations[self.other.username]
                     try:
-                        messages = conversations[self.other.username]['messages']
+                        messages = conversation['messages']
                     except:
                         messages = []
         except:
             messages = []
+
+        start, end, _ = slice(start, end).indices(len(messages))
         
         # Decrypt the messages
-        self.kfd = KDF(self.chain_key, self.salt, 256)
+        kdf = self.kdf_at(conversation, start)
 
         decrypted_messages = []
-        for message in messages:
-            decrypted_message = SerpentCipher(self.kfd.derive()).decrypt(message['message'])
+        for message in messages[start:end]:
+            decrypted_message = SerpentCipher(kdf.derive()).decrypt(message['message'])
             decrypted_messages.append({
                 'id': message['id'],
                 'sender': message['sender'],
@@ -162,12 +224,13 @@ class Conversation:
 
 
     @staticmethod
-    def save_message_in_conversation(sender, receiver, message, owner):
+    def save_message_in_conversation(sender, receiver, message, owner, ratchet=None):
         """
         Saves a message in a conversation
         :param me: The user
         :param other: The other user
         :param message: The message
+        :param ratchet: The ratchet state after this message (optional)
         :return: None
         """
         other = sender if owner is not sender else receiver
@@ -191,11 +254,9 @@ class Conversation:
                     'time': time.time()
                 })
 
-                conversations[other.username] = {
-                    'chain_key': conversations[other.username]['chain_key'],
-                    'salt': conversations[other.username]['salt'],
-                    'messages': messages
-                }
+                conversations[other.username]['messages'] = messages
+                if ratchet:
+                    conversations[other.username]['ratchet'] = ratchet
         except Exception as e:
             raise Exception("No conversation with this user")
         
@@ -204,6 +265,31 @@ class Conversation:
             json.dump(conversations, f)
         
 
+    @staticmethod
+    def save_checkpoint_in_conversation(sender, receiver, checkpoint, owner):
+        """
+        Saves a KDF checkpoint in a conversation
+        :param sender: The user
+        :param receiver: The other user
+        :param checkpoint: The iteration and the encrypted chain key
+        :param owner: The user owning the conversation file
+        :return: None
+        """
+        other = sender if owner is not sender else receiver
+        try:
+            with open(f"src/tools/conversations/{owner.username}.json", "r") as f:
+                conversations = json.load(f)
+
+                checkpoints = KDFCheckpoints(conversations[other.username].get('checkpoints'))
+                checkpoints.add(*checkpoint)
+                conversations[other.username]['checkpoints'] = checkpoints.to_dict()
+        except Exception:
+            raise Exception("No conversation with this user")
+
+        with open(f"src/tools/conversations/{owner.username}.json", "w") as f:
+            json.dump(conversations, f)
+
+
     @staticmethod
     def get_number_of_messages(me, other):
         """
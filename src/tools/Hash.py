@@ -1,8 +1,233 @@
 import struct
+import logging
 
-def sha256(message):
+from tools import ProcessPool
+
+try:
+    import hashlib
+    import hmac
+except ImportError:
+    hashlib = None
+    hmac = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Constants
+K = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+]
+
+# Initial hash values
+H0 = [
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+]
+
+
+def compress(H, block):
     """
-    SHA-256 hash algorithm
+    SHA-256 compression function
+    :param H: hash state, 8 words of 32 bits
+    :param block: 64 bytes block
+    :return: new hash state
+    """
+    W = list(struct.unpack('>16I', block)) + [0] * 48
+
+    for t in range(16, 64):
+        s0 = (W[t - 15] >> 7 | W[t - 15] << 25) ^ (W[t - 15] >> 18 | W[t - 15] << 14) ^ (W[t - 15] >> 3)
+        s1 = (W[t - 2] >> 17 | W[t - 2] << 15) ^ (W[t - 2] >> 19 | W[t - 2] << 13) ^ (W[t - 2] >> 10)
+        W[t] = (W[t - 16] + s0 + W[t - 7] + s1) & 0xFFFFFFFF
+
+    a, b, c, d, e, f, g, h = H
+
+    for t in range(64):
+        S1 = (e >> 6 | e << 26) ^ (e >> 11 | e << 21) ^ (e >> 25 | e << 7)
+        ch = (e & f) ^ (~e & g)
+        temp1 = h + S1 + ch + K[t] + W[t]
+        S0 = (a >> 2 | a << 30) ^ (a >> 13 | a << 19) ^ (a >> 22 | a << 10)
+        maj = (a & b) ^ (a & c) ^ (b & c)
+        temp2 = S0 + maj
+
+        h = g
+        g = f
+        f = e
+        e = (d + temp1) & 0xFFFFFFFF
+        d = c
+        c = b
+        b = a
+        a = (temp1 + temp2) & 0xFFFFFFFF
+
+    return [
+        (H[0] + a) & 0xFFFFFFFF,
+        (H[1] + b) & 0xFFFFFFFF,
+        (H[2] + c) & 0xFFFFFFFF,
+        (H[3] + d) & 0xFFFFFFFF,
+        (H[4] + e) & 0xFFFFFFFF,
+        (H[5] + f) & 0xFFFFFFFF,
+        (H[6] + g) & 0xFFFFFFFF,
+        (H[7] + h) & 0xFFFFFFFF,
+    ]
+
+
+def padding(length):
+    """
+    SHA-256 padding of a message
+    A single '1' bit, zeros up to 56 bytes modulo 64, then the length in bits
+    :param length: length of the message in bytes
+    :return: bytes
+    """
+    return b'\x80' + b'\x00' * ((55 - length) % 64) + struct.pack('>Q', length * 8)
+
+
+class SHA256():
+    """
+    Incremental SHA-256, pure Python
+    Blocks of 64 bytes are compressed as they arrive, only the incomplete last block is buffered.
+    """
+
+    digest_size = 32
+    block_size = 64
+
+    def __init__(self, message=b''):
+        self.H = list(H0)
+        self.buffer = b''
+        self.length = 0
+        if message:
+            self.update(message)
+
+    def update(self, message):
+        """
+        Absorb more data
+        :param message: bytes
+        """
+        message = memoryview(message).cast('B')
+        self.length += len(message)
+
+        # Complete the buffered block first
+        if self.buffer:
+            missing = 64 - len(self.buffer)
+            self.buffer += bytes(message[:missing])
+            message = message[missing:]
+            if len(self.buffer) < 64:
+                return
+            self.H = compress(self.H, self.buffer)
+            self.buffer = b''
+
+        end = len(message) - len(message) % 64
+        H = self.H
+        for i in range(0, end, 64):
+            H = compress(H, message[i:i + 64])
+        self.H = H
+        self.buffer = bytes(message[end:])
+
+    def copy(self):
+        """
+        Copy of the hash state, e.g. to hash several messages sharing a prefix
+        :return: SHA256
+        """
+        other = SHA256()
+        other.H = list(self.H)
+        other.buffer = self.buffer
+        other.length = self.length
+        return other
+
+    def digest(self):
+        """
+        Digest of the data absorbed so far, the object can still be updated
+        :return: 32 bytes
+        """
+        tail = self.buffer + padding(self.length)
+
+        H = self.H
+        for i in range(0, len(tail), 64):
+            H = compress(H, tail[i:i + 64])
+
+        return struct.pack('>8I', *H)
+
+    def hexdigest(self):
+        """
+        Hex digest of the data absorbed so far
+        :return: str
+        """
+        return self.digest().hex()
+
+
+class HMAC():
+    """
+    Incremental HMAC-SHA-256
+    The inner and outer padded keys are absorbed once per key, copy() reuses
+    them for other messages under the same key.
+    """
+
+    block_size = 64
+
+    def __init__(self, key, message=None, digestmod=None):
+        """
+        :param key: bytes
+        :param message: bytes (optional)
+        :param digestmod: hash constructor, new() by default
+        """
+        digestmod = digestmod or new
+
+        # Key padding
+        if len(key) > HMAC.block_size:
+            key = digestmod(key).digest()
+        key = key + b'\x00' * (HMAC.block_size - len(key))
+
+        # Inner and outer padding
+        self.inner = digestmod(bytes(x ^ 0x36 for x in key))
+        self.outer = digestmod(bytes(x ^ 0x5C for x in key))
+
+        if message:
+            self.update(message)
+
+    def update(self, message):
+        """
+        Absorb more data
+        :param message: bytes
+        """
+        self.inner.update(message)
+
+    def copy(self):
+        """
+        Copy of the HMAC state
+        :return: HMAC
+        """
+        other = HMAC.__new__(HMAC)
+        other.inner = self.inner.copy()
+        other.outer = self.outer.copy()
+        return other
+
+    def digest(self):
+        """
+        HMAC of the data absorbed so far
+        :return: 32 bytes
+        """
+        outer = self.outer.copy()
+        outer.update(self.inner.digest())
+        return outer.digest()
+
+    def hexdigest(self):
+        """
+        Hex HMAC of the data absorbed so far
+        :return: str
+        """
+        return self.digest().hex()
+
+
+def sha256_reference(message):
+    """
+    SHA-256 hash algorithm, pure Python reference implementation
     """
 
     # Constants
@@ -75,12 +300,15 @@ def sha256(message):
     # Final hash
     return ''.join(format(h, '08x') for h in H)
 
-def hmac_sha256(key, message):
+def hmac_sha256_reference(key, message):
+    """
+    HMAC-SHA-256, pure Python reference implementation
+    """
     block_size = 64  # SHA-256 block size in bytes
 
     # Key padding
     if len(key) > block_size:
-        key = sha256(key)
+        key = sha256_reference(key)
     elif len(key) < block_size:
         key += b'\x00' * (block_size - len(key))
 
@@ -92,10 +320,236 @@ def hmac_sha256(key, message):
 
     # Inner hash
     inner_hash_input = bytes(inner_pad) + message
-    inner_hash = bytes.fromhex(sha256(inner_hash_input))
+    inner_hash = bytes.fromhex(sha256_reference(inner_hash_input))
 
     # Outer hash
     outer_hash_input = bytes(outer_pad) + inner_hash
-    outer_hash = sha256(outer_hash_input)
+    outer_hash = sha256_reference(outer_hash_input)
+
+    return outer_hash
+
+
+def sha256_python(message):
+    """
+    SHA-256 hash algorithm, pure Python implementation of the SHA256 class
+    """
+    return SHA256(message).hexdigest()
+
+
+def hmac_sha256_python(key, message):
+    """
+    HMAC-SHA-256, pure Python implementation of the HMAC class
+    """
+    return HMAC(key, message, digestmod=SHA256).hexdigest()
+
+
+def sha256_hashlib(message):
+    """
+    SHA-256 hash algorithm, hashlib implementation
+    """
+    return hashlib.sha256(message).hexdigest()
+
+
+def hmac_sha256_hashlib(key, message):
+    """
+    HMAC-SHA-256, hmac implementation
+    """
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+# Backend name -> (sha256, hmac_sha256)
+BACKENDS = {
+    "python": (sha256_python, hmac_sha256_python),
+}
+if hashlib is not None:
+    BACKENDS["hashlib"] = (sha256_hashlib, hmac_sha256_hashlib)
+
+_backend = BACKENDS["python"]
+_backend_name = "python"
+
+
+def set_backend(name):
+    """
+    Select the implementation used by sha256() and hmac_sha256()
+    :param name: "python" or "hashlib"
+    """
+    global _backend, _backend_name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown hash backend: {name}")
+    _backend = BACKENDS[name]
+    _backend_name = name
+
+
+def get_backend():
+    """
+    Name of the implementation used by sha256() and hmac_sha256()
+    """
+    return _backend_name
+
+
+def new(message=b''):
+    """
+    Incremental SHA-256 object of the current backend
+    :param message: bytes (optional)
+    :return: object with update(), copy(), digest() and hexdigest()
+    """
+    if _backend_name == "hashlib":
+        return hashlib.sha256(message)
+    return SHA256(message)
+
+
+def sha256(message):
+    """
+    SHA-256 hash algorithm
+    :param message: bytes
+    :return: hex digest
+    """
+    return _backend[0](message)
+
+
+def hmac_sha256(key, message):
+    """
+    HMAC-SHA-256
+    :param key: bytes
+    :param message: bytes
+    :return: hex digest
+    """
+    return _backend[1](key, message)
+
+
+# Number of messages from which sha256_many() spreads the work on the shared process pool
+PARALLEL_THRESHOLD = 4096
+
+
+def sha256_many(messages, workers=None):
+    """
+    SHA-256 of many messages
+    With the hashlib backend, each message is hashed by hashlib. With the
+    pure Python backend, messages with the same number of blocks are hashed
+    together as lanes of NumPy arrays when NumPy is available.
+    :param messages: list of bytes
+    :param workers: number of shards on the shared process pool for batches of at least PARALLEL_THRESHOLD messages (optional)
+    :return: list of hex digests, in the order of the messages
+    """
+    messages = list(messages)
+
+    if workers and workers > 1 and len(messages) >= PARALLEL_THRESHOLD:
+        shards = ProcessPool.map_shards(sha256_many_worker, messages, _backend_name, count=workers)
+        return [digest for digests in shards for digest in digests]
+
+    return sha256_many_worker(messages, _backend_name)
+
+
+def sha256_many_worker(messages, backend):
+    """
+    SHA-256 of many messages with a given backend, the current backend is left unchanged
+    :param messages: list of bytes
+    :param backend: "python" or "hashlib"
+    :return: list of hex digests, in the order of the messages
+    """
+    if backend == "python" and numpy is not None:
+        return sha256_many_numpy(messages)
+
+    return [BACKENDS[backend][0](message) for message in messages]
+
+
+def sha256_many_numpy(messages):
+    """
+    SHA-256 of many messages, pure Python on NumPy lanes
+    Each word of the hash state is a uint32 array with one value per message.
+    :param messages: list of bytes
+    :return: list of hex digests, in the order of the messages
+    """
+    digests = [None] * len(messages)
+
+    # Messages grouped by number of blocks once padded
+    groups = {}
+    for index, message in enumerate(messages):
+        padded = bytes(message) + padding(len(message))
+        groups.setdefault(len(padded) // 64, []).append((index, padded))
+
+    for blocks, group in groups.items():
+        words = numpy.frombuffer(b''.join(padded for _, padded in group), dtype='>u4')
+        words = words.reshape(len(group), blocks, 16).astype(numpy.uint32)
+
+        H = [numpy.full(len(group), h, dtype=numpy.uint32) for h in H0]
+        for block in range(blocks):
+            H = compress_numpy(H, words[:, block, :])
+
+        state = numpy.stack(H, axis=1).astype('>u4').tobytes()
+        for lane, (index, _) in enumerate(group):
+            digests[index] = state[32 * lane:32 * lane + 32].hex()
+
+    return digests
+
+
+def compress_numpy(H, block):
+    """
+    SHA-256 compression function on NumPy lanes
+    :param H: hash state, 8 uint32 arrays
+    :param block: uint32 array of shape (lanes, 16)
+    :return: new hash state
+    """
+    W = [numpy.ascontiguousarray(block[:, t]) for t in range(16)]
+
+    # uint32 arithmetic wraps modulo 2^32
+    for t in range(16, 64):
+        s0 = (W[t - 15] >> 7 | W[t - 15] << 25) ^ (W[t - 15] >> 18 | W[t - 15] << 14) ^ (W[t - 15] >> 3)
+        s1 = (W[t - 2] >> 17 | W[t - 2] << 15) ^ (W[t - 2] >> 19 | W[t - 2] << 13) ^ (W[t - 2] >> 10)
+        W.append(W[t - 16] + s0 + W[t - 7] + s1)
+
+    a, b, c, d, e, f, g, h = H
+
+    for t in range(64):
+        S1 = (e >> 6 | e << 26) ^ (e >> 11 | e << 21) ^ (e >> 25 | e << 7)
+        ch = (e & f) ^ (~e & g)
+        temp1 = h + S1 + ch + numpy.uint32(K[t]) + W[t]
+        S0 = (a >> 2 | a << 30) ^ (a >> 13 | a << 19) ^ (a >> 22 | a << 10)
+        maj = (a & b) ^ (a & c) ^ (b & c)
+        temp2 = S0 + maj
+
+        h = g
+        g = f
+        f = e
+        e = d + temp1
+        d = c
+        c = b
+        b = a
+        a = temp1 + temp2
+
+    return [H[0] + a, H[1] + b, H[2] + c, H[3] + d, H[4] + e, H[5] + f, H[6] + g, H[7] + h]
+
+
+def self_test(name):
+    """
+    Check that a backend gives the same results as the reference implementation
+    The "python" backend also checks the SHA256 and HMAC classes fed in several updates
+    :param name: backend name
+    :return: True if the backend agrees with the reference
+    """
+    sha256_backend, hmac_sha256_backend = BACKENDS[name]
+    for length in (0, 1, 55, 56, 63, 64, 65, 200):
+        message = bytes(i % 256 for i in range(length))
+        key = b"key" * (length % 21)
+        if sha256_backend(message) != sha256_reference(message):
+            return False
+        if hmac_sha256_backend(key, message) != hmac_sha256_reference(key, message):
+            return False
+
+        if name == "python":
+            hash = SHA256()
+            mac = HMAC(key, digestmod=SHA256)
+            for i in range(0, length, 7):
+                hash.update(message[i:i + 7])
+                mac.update(message[i:i + 7])
+            if hash.hexdigest() != sha256_reference(message) or mac.hexdigest() != hmac_sha256_reference(key, message):
+                return False
+    return True
+
 
-    return outer_hash
\ No newline at end of file
+# Use hashlib when it is available and agrees with the reference implementation
+if "hashlib" in BACKENDS:
+    if self_test("hashlib"):
+        set_backend("hashlib")
+    else:
+        logging.warning("hashlib SHA-256 does not match the reference implementation, using the pure Python one")
\ No newline at end of file
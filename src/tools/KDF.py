@@ -1,31 +1,76 @@
-from tools.Hash import hmac_sha256
+from tools.Hash import HMAC
 import bitarray
 import string
 import random
+import bisect
+from collections import OrderedDict
 
 class KDF():
     """
     Key derivation function
     """
-    def __init__(self, chain_key, salt, length):
+
+    # Number of derivation steps kept by the process-wide cache
+    CACHE_SIZE = 65536
+
+    # (chain_key, salt, iteration) -> (message_key, next chain_key)
+    cache = OrderedDict()
+
+    def __init__(self, chain_key, salt, length, iteration=0):
         self.chain_key = chain_key
         self.salt = salt
         self.length = length
-        self.iteration = 0
+        self.iteration = iteration
+        self.mac = None
 
     def __str__(self) -> str:
         return f"KDF(chain_key={self.chain_key}, salt={self.salt}, iteration={self.iteration})"
 
 
+    def seek(self, chain_key, iteration):
+        """
+        Move the chain to a saved checkpoint
+        :param chain_key: chain key at this iteration
+        :param iteration: iteration of the checkpoint
+        """
+        self.chain_key = chain_key
+        self.iteration = iteration
+
+    def hmac_context(self):
+        """
+        HMAC keyed with the current chain key
+        The padded keys are absorbed once and reused for both derivations of an iteration.
+        :return: HMAC to copy() before use
+        """
+        if self.mac is None or self.mac[0] != self.chain_key:
+            self.mac = (self.chain_key, HMAC(self.chain_key.encode()))
+        return self.mac[1]
+
     def derive(self):
-        # Message key derivation
-        content = str(self.chain_key) + str(self.salt) + str(self.iteration)
-        message_key = hmac_sha256(self.chain_key.encode(), content.encode())
+        cache_key = (self.chain_key, self.salt, self.iteration)
+        if cache_key in KDF.cache:
+            KDF.cache.move_to_end(cache_key)
+            message_key, chain_key = KDF.cache[cache_key]
+        else:
+            mac = self.hmac_context()
+
+            # Message key derivation
+            content = str(self.chain_key) + str(self.salt) + str(self.iteration)
+            message_mac = mac.copy()
+            message_mac.update(content.encode())
+            message_key = message_mac.hexdigest()
 
-        # Chain key derivation
-        content = str(self.salt) + str(self.chain_key) + str(self.iteration)
-        self.chain_key = hmac_sha256(self.chain_key.encode(), content.encode())
+            # Chain key derivation
+            content = str(self.salt) + str(self.chain_key) + str(self.iteration)
+            chain_mac = mac.copy()
+            chain_mac.update(content.encode())
+            chain_key = chain_mac.hexdigest()
 
+            KDF.cache[cache_key] = (message_key, chain_key)
+            if len(KDF.cache) > KDF.CACHE_SIZE:
+                KDF.cache.popitem(last=False)
+
+        self.chain_key = chain_key
         self.iteration += 1
 
         bt = bitarray.bitarray()
@@ -42,3 +87,53 @@ class KDF():
         return "".join([random.choice(string.ascii_letters) for _ in range(32)])
         
 
+
+class KDFCheckpoints():
+    """
+    Chain keys of a KDF saved every INTERVAL iterations
+    A message key is derived from the nearest checkpoint before it instead of
+    from the start of the chain.
+    """
+
+    INTERVAL = 128
+
+    def __init__(self, checkpoints=None, interval=None):
+        self.interval = interval or KDFCheckpoints.INTERVAL
+        self.checkpoints = {int(iteration): chain_key for iteration, chain_key in (checkpoints or {}).items()}
+        self.iterations = sorted(self.checkpoints)
+
+    def is_due(self, iteration):
+        """
+        Whether the chain key of this iteration should be saved
+        :param iteration: iteration of the KDF
+        :return: bool
+        """
+        return iteration > 0 and iteration % self.interval == 0
+
+    def add(self, iteration, chain_key):
+        """
+        Save the chain key of an iteration
+        :param iteration: iteration of the KDF
+        :param chain_key: chain key at this iteration
+        """
+        if iteration not in self.checkpoints:
+            bisect.insort(self.iterations, iteration)
+        self.checkpoints[iteration] = chain_key
+
+    def nearest(self, iteration):
+        """
+        Nearest checkpoint at or before an iteration
+        :param iteration: iteration of the KDF
+        :return: (iteration, chain key) or None
+        """
+        index = bisect.bisect_right(self.iterations, iteration) - 1
+        if index < 0:
+            return None
+        return self.iterations[index], self.checkpoints[self.iterations[index]]
+
+    def to_dict(self):
+        """
+        JSON serializable checkpoints
+        :return: dict
+        """
+        return {str(iteration): self.checkpoints[iteration] for iteration in self.iterations}
@@ -0,0 +1,159 @@
+from tools.Cipher import RSA
+from tools.Cipher import SerpentCipher
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class KeyPool():
+    """
+    Pool of RSA key pairs generated in advance
+    A background thread refills the pool when it falls below the low-water mark.
+    The spool is a directory with one file per key pair, encrypted with Serpent.
+    The Serpent key is in a file only readable by its owner. Entries are claimed
+    and added under an exclusive lock of the spool, so pools of several processes
+    on the same spool never hand out the same key pair (the lock needs fcntl,
+    without it only the pools of one process are kept apart).
+    """
+
+    # Locks of the spools used in this process
+    thread_locks = {}
+
+    # Extension of the key pair entries of the spool
+    ENTRY = ".pair"
+
+    # Number of key pairs kept ready
+    SIZE = 8
+
+    # Number of key pairs below which the pool is refilled
+    LOW_WATER = 2
+
+    def __init__(self, path, size=None, low_water=None):
+        """
+        :param path: directory of the spool, the Serpent key is in path/spool.key
+        :param size: number of key pairs kept ready (optional)
+        :param low_water: number of key pairs below which the pool is refilled (optional)
+        """
+        self.path = path
+        self.size = size or KeyPool.SIZE
+        self.low_water = KeyPool.LOW_WATER if low_water is None else low_water
+        self.lock = KeyPool.thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+        self.worker = None
+        self.worker_lock = threading.Lock()
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        with self.locked():
+            self.cipher = SerpentCipher(self.load_key(), mode="cbc")
+
+    def __len__(self):
+        with self.locked():
+            return len(self.entries())
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Exclusive access to the spool, between the threads and between the processes
+        """
+        with self.lock:
+            with open(os.path.join(self.path, "spool.lock"), "a") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load_key(self):
+        """
+        Gets the Serpent key of the spool, created with mode 0600 if missing
+        :return: 256 bits key
+        """
+        path = os.path.join(self.path, "spool.key")
+        try:
+            with open(path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Created under locked(), no other pool can be writing it
+            key = ''.join(format(byte, '08b') for byte in os.urandom(32))
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(key)
+            return key
+
+    def entries(self):
+        """
+        Names of the key pair entries, oldest first
+        :return: list of file names
+        """
+        return sorted(name for name in os.listdir(self.path) if name.endswith(KeyPool.ENTRY))
+
+    def take(self):
+        """
+        Takes a key pair from the pool and starts a refill if needed
+        Only the claimed entry is read and decrypted, the others are not touched
+        :return: (public key, private key), None if the pool is empty
+        """
+        with self.locked():
+            entries = self.entries()
+            if not entries:
+                data = None
+            else:
+                path = os.path.join(self.path, entries[0])
+                with open(path, "r") as f:
+                    data = f.read()
+                os.unlink(path)
+
+        self.start(remaining=max(len(entries) - 1, 0))
+        if data is None:
+            return None
+        public_key, private_key = json.loads(self.cipher.decrypt(data))
+        return tuple(public_key), tuple(private_key)
+
+    def start(self, remaining=None):
+        """
+        Starts the background refill if the pool is below the low-water mark
+        :param remaining: number of key pairs in the pool, counted if not given (optional)
+        :return: None
+        """
+        if remaining is None:
+            remaining = len(self)
+        with self.worker_lock:
+            if remaining > self.low_water or (self.worker is not None and self.worker.is_alive()):
+                return
+            self.worker = threading.Thread(target=self.refill, args=(remaining,), daemon=True)
+            self.worker.start()
+
+    def refill(self, count):
+        """
+        Generates key pairs until the pool is full
+        :param count: number of key pairs in the pool when the refill starts
+        :return: None
+        """
+        while count < self.size:
+            data = self.cipher.encrypt(json.dumps(RSA.keyGen()))
+            with self.locked():
+                # Other pools may have taken or added key pairs meanwhile
+                count = len(self.entries())
+                if count >= self.size:
+                    return
+                name = f"{time.time_ns():020d}-{os.urandom(4).hex()}"
+                fd = os.open(os.path.join(self.path, name + ".tmp"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    f.write(data)
+                os.replace(os.path.join(self.path, name + ".tmp"), os.path.join(self.path, name + KeyPool.ENTRY))
+                count += 1
+
+    def wait(self):
+        """
+        Waits for the background refill to finish
+        :return: None
+        """
+        worker = self.worker
+        if worker is not None:
+            worker.join()
@@ -1,12 +1,38 @@
 import random
 import bitarray
 
+def small_primes(limit):
+    """
+    Sieve of Eratosthenes
+    :param limit: upper bound, excluded
+    :return: list of the primes below limit
+    """
+    sieve = bytearray([1]) * limit
+    sieve[:2] = b'\x00\x00'
+    for i in range(2, int(limit ** 0.5) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytearray(len(range(i * i, limit, i)))
+    return [i for i in range(limit) if sieve[i]]
+
+
 class ModularMath:
     """
     Modular Math Class
     Static methods for modular math operations
     """
 
+    # Primes used to sieve the candidates of generate_prime_number
+    SMALL_PRIMES = small_primes(2048)
+
+    # Number of odd candidates sieved at once
+    SIEVE_WINDOW = 4096
+
+    # Miller-Rabin rounds for random candidates of at least this many bits
+    MILLER_RABIN_ROUNDS = ((1300, 2), (850, 3), (650, 4), (550, 5), (450, 6), (400, 7), (350, 8), (300, 9), (250, 12), (200, 15), (150, 18))
+
+    # Counters of generate_prime_number
+    prime_stats = {'candidates': 0, 'sieve_rejects': 0, 'miller_rabin_rejects': 0, 'primes': 0}
+
     @staticmethod
     def gcd(a, b):
         """
@@ -63,16 +89,75 @@ class ModularMath:
         return True
 
     @staticmethod
-    def generate_prime_number(bits):
+    def miller_rabin_rounds(bits):
+        """
+        Number of Miller-Rabin rounds for a random candidate
+        Error probability below 2^-80 for random candidates of this size
+        :param bits: number of bits of the candidate
+        :return: number of rounds
+        """
+        for size, rounds in ModularMath.MILLER_RABIN_ROUNDS:
+            if bits >= size:
+                return rounds
+        return 27
+
+    @staticmethod
+    def reset_prime_stats():
+        """
+        Resets the counters of generate_prime_number
+        :return: None
+        """
+        for name in ModularMath.prime_stats:
+            ModularMath.prime_stats[name] = 0
+
+    @staticmethod
+    def generate_prime_number(bits, stop=None):
         """
         Generate a prime number with a given number of bits
+        Odd candidates with the two top bits set are sieved by the small primes
+        over a window, only the survivors go through Miller-Rabin
         :param bits: number of bits
-        :return: prime number
+        :param stop: event ending the search when set, e.g. by another process (optional)
+        :return: prime number, None if stopped
         """
-        while True:
-            n = random.randrange(2**(bits-1), 2**(bits))
-            if ModularMath.is_prime(n):
-                return n
+        stats = ModularMath.prime_stats
+        rounds = ModularMath.miller_rabin_rounds(bits)
+
+        if bits < 16:
+            while stop is None or not stop.is_set():
+                n = random.randrange(2**(bits-1), 2**(bits)) | 1
+                stats['candidates'] += 1
+                if ModularMath.is_prime(n, rounds):
+                    stats['primes'] += 1
+                    return n
+                stats['miller_rabin_rejects'] += 1
+            return None
+
+        window = ModularMath.SIEVE_WINDOW
+        while stop is None or not stop.is_set():
+            base = random.getrandbits(bits) | (3 << (bits - 2)) | 1
+
+            # composite[i] is set when base + 2 * i has an odd small factor
+            composite = bytearray(window)
+            for prime in ModularMath.SMALL_PRIMES[1:]:
+                first = (-(base % prime) * ((prime + 1) // 2)) % prime
+                composite[first::prime] = b'\x01' * len(range(first, window, prime))
+
+            for i in range(window):
+                n = base + 2 * i
+                if n >> bits:
+                    break
+                stats['candidates'] += 1
+                if composite[i]:
+                    stats['sieve_rejects'] += 1
+                    continue
+                if ModularMath.is_prime(n, rounds):
+                    stats['primes'] += 1
+                    return n
+                stats['miller_rabin_rejects'] += 1
+                if stop is not None and stop.is_set():
+                    return None
+        return None
 
 
     @staticmethod
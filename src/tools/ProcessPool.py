@@ -0,0 +1,108 @@
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import threading
+
+# Process pool shared by the parallel operations, started on first use
+pool = None
+
+# Number of worker processes of the pool
+WORKERS = os.cpu_count() or 1
+
+# Event ending the searches run on the pool, see search()
+# In the workers it is set by init_worker
+stop = None
+
+# Only one search at a time uses the stop event
+search_lock = threading.Lock()
+
+
+def init_worker(event):
+    """
+    Initializes a worker process of the pool
+    :param event: stop event of the searches
+    :return: None
+    """
+    global stop
+    stop = event
+
+
+def configure_pool(workers=None):
+    """
+    Configures the pool, the current pool is shut down and a new one is started on next use
+    :param workers: number of worker processes, number of cores by default
+    :return: None
+    """
+    global WORKERS
+    shutdown_pool()
+    WORKERS = workers or os.cpu_count() or 1
+
+
+def get_pool():
+    """
+    Process pool shared by the parallel operations, started on first use
+    :return: ProcessPoolExecutor
+    """
+    global pool, stop
+    if pool is None:
+        stop = multiprocessing.Event()
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=WORKERS, initializer=init_worker, initargs=(stop,))
+    return pool
+
+
+def shutdown_pool():
+    """
+    Shuts down the process pool
+    :return: None
+    """
+    global pool
+    if pool is not None:
+        pool.shutdown()
+        pool = None
+
+
+def shards(items, count, align=1):
+    """
+    Splits a sequence in at most count contiguous shards
+    :param items: list, bytes...
+    :param count: number of shards
+    :param align: the shard sizes are multiples of align
+    :return: list of shards
+    """
+    if not items:
+        return []
+    units = -(-len(items) // align)
+    size = -(-units // max(count, 1)) * align
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def map_shards(function, items, *args, count=None, align=1):
+    """
+    Runs function(shard, *args) on the pool for contiguous shards of items
+    :param function: picklable function
+    :param items: list, bytes...
+    :param args: other arguments of the function
+    :param count: number of shards, number of workers by default
+    :param align: the shard sizes are multiples of align
+    :return: list of the results, in the order of the shards
+    """
+    executor = get_pool()
+    futures = [executor.submit(function, shard, *args) for shard in shards(items, count or WORKERS, align)]
+    return [future.result() for future in futures]
+
+
+@contextlib.contextmanager
+def search():
+    """
+    Exclusive use of the stop event for a search run on the pool
+    The event is cleared on entry and set on exit. Before leaving, the caller
+    sets it and waits for its tasks so that none keeps running afterwards.
+    """
+    with search_lock:
+        get_pool()
+        stop.clear()
+        try:
+            yield stop
+        finally:
+            stop.set()
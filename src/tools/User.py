@@ -8,6 +8,9 @@ import random
 
 class User():
 
+    # KeyPool of key pairs generated in advance, used by create_user (optional)
+    key_pool = None
+
     def __init__(self, username: str):
         self.username = username
         
@@ -75,12 +78,14 @@ class User():
         
         return True
     
-    def get_messages_conversation(self):
+    def get_messages_conversation(self, start=0, end=None):
         """
         Gets the messages from the conversation
+        :param start: Index of the first message (optional)
+        :param end: Index after the last message (optional)
         :return: The messages
         """
-        return self.conversation.get_messages()
+        return self.conversation.get_messages(start, end)
     
     def send_message_asymetric(self, message, recipient_name):
         """
@@ -241,6 +246,8 @@ class User():
         if username in public_keys:
             raise ValueError("User already exists")
         
+        if not keys and User.key_pool is not None:
+            keys = User.key_pool.take()
         if not keys:
             keys = RSA.keyGen()
 